@@ -2,18 +2,27 @@
 """
 Module contenant la classe neurone
 """
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+build_callbacks = __import__('30-hooks').build_callbacks
+sparse_input = __import__('33-sparse_input')
+_as_input = sparse_input.as_input
+_matmul = sparse_input.matmul
+_matmul_transposed = sparse_input.matmul_transposed
+
 
 class NeuralNetwork:
     """
     Une classe qui définit un réseau de neurones avec une couche cachée effectuant une classification binaire
     """
 
-    def __init__(self, nx, nodes):
+    def __init__(self, nx, nodes, dtype=np.float64, optimizer=None):
         """
         constructeur de la classe
         la variable nx: est le nombre d'entités d'entrée du neurone
+        la variable dtype: type flottant des poids et de tous les calculs
+        la variable optimizer: optimiseur (31-optimizers) utilisé par la
+        descente de gradient, ou None pour W - alpha * dW
         """
         if type(nx) is not int:
             raise TypeError("nx must be an integer")
@@ -24,12 +33,18 @@ class NeuralNetwork:
             raise TypeError("nodes must be an integer")
         if nodes < 1:
             raise ValueError("nodes must be a positive integer")
+        if not np.issubdtype(dtype, np.floating):
+            raise TypeError("dtype must be a floating point type")
+        if optimizer is not None and not hasattr(optimizer, "update"):
+            raise TypeError("optimizer must provide an update method")
+        self.__dtype = np.dtype(dtype)
+        self.__optimizer = optimizer
         # hidden layer
-        self.__W1 = np.random.randn(nodes, nx)
-        self.__b1 = np.zeros((nodes, 1))
+        self.__W1 = np.random.randn(nodes, nx).astype(self.__dtype)
+        self.__b1 = np.zeros((nodes, 1), dtype=self.__dtype)
         self.__A1 = 0
         # output neuron
-        self.__W2 = np.random.randn(1, nodes)
+        self.__W2 = np.random.randn(1, nodes).astype(self.__dtype)
         self.__b2 = 0
         self.__A2 = 0
 
@@ -39,7 +54,8 @@ class NeuralNetwork:
          Le paramètre X: tableau np avec les données d'entrée de forme (nx, m)
          elle retourne : les attributs privés __A1 et __A2
         """
-        z1 = np.matmul(self.__W1, X) + self.__b1
+        X = _as_input(X, self.__dtype)
+        z1 = _matmul(self.__W1, X) + self.__b1
         self.__A1 = 1 / (1 + np.exp(-z1))
         z2 = np.matmul(self.__W2, self.__A1) + self.__b2
         self.__A2 = 1 / (1 + np.exp(-z2))
@@ -52,6 +68,10 @@ class NeuralNetwork:
          Le paramètre A: un tableau np avec la sortie activée de shape (1, m)
          elle retourne : le coût
         """
+        Y = np.asarray(Y, dtype=A.dtype)
+        # A est borné pour que 0 * log(0) ne donne pas NaN en float32
+        info = np.finfo(A.dtype)
+        A = np.clip(A, info.tiny, 1 - info.eps)
         cost = Y * np.log(A) + (1 - Y) * np.log(1.0000001 - A)
         cost = np.sum(cost)
         cost = - cost / A.shape[1]
@@ -79,8 +99,9 @@ class NeuralNetwork:
          Le paramètre alpha: le taux d'apprentissage
          elle ne retourne rien
         """
+        X = _as_input(X, self.__dtype)
         # gradient descent for hidden layer
-        dz2 = A2 - Y
+        dz2 = A2 - np.asarray(Y, dtype=self.__dtype)
         dw2 = np.matmul(A1, dz2.T) / A1.shape[1]
         db2 = np.sum(dz2, axis=1, keepdims=True) / A2.shape[1]
 
@@ -89,22 +110,32 @@ class NeuralNetwork:
         # gradient descent for output layer
         dz1 = np.matmul(self.__W2.T, dz2)
         dz1 = dz1 * da1
-        dw1 = np.matmul(X, dz1.T) / A1.shape[1]
+        dw1 = _matmul_transposed(dz1, X) / A1.shape[1]
         db1 = np.sum(dz1, axis=1, keepdims=True) / A1.shape[1]
         # updated value for weights and bias
+        if self.__optimizer is not None:
+            (
+                self.__W2, self.__b2, self.__W1, self.__b1
+            ) = self.__optimizer.update(
+                [self.__W2, self.__b2, self.__W1, self.__b1],
+                [dw2.T, db2, dw1, db1], alpha
+            )
+            return
         self.__W2 = self.__W2 - alpha * dw2.T
         self.__b2 = self.__b2 - alpha * db2
-        self.__W1 = self.__W1 - alpha * dw1.T
+        self.__W1 = self.__W1 - alpha * dw1
         self.__b1 = self.__b1 - alpha * db1
 
     def train(self, X, Y, iterations=5000, alpha=0.05, verbose=True,
-              graph=True, step=100):
+              graph=True, step=100, callbacks=None):
         """
         Fonction pour former le réseau neuronal
          Le paramètre X: tableau np avec des données d'entrée de forme (nx, m)
          Le paramètre Y: tableau np avec des étiquettes correctes de forme (1, m)
          Le paramètre itérations: itérations de l'entraînement
          Le paramètre alpha: taux d'apprentissage
+         Le paramètre callbacks: liste de callbacks (30-hooks) notifiés à
+         chaque phase ; le coût n'est calculé que s'ils le demandent
          elle retourne : l'évaluation des données d'entraînement
         """
         if type(iterations) is not int:
@@ -125,23 +156,31 @@ class NeuralNetwork:
                 raise TypeError("step must be an integer")
             if step <= 0 or step > iterations:
                 raise ValueError("step must be positive and <= iterations")
-        cost = []
+        hooks = build_callbacks(
+            verbose, graph, step, callbacks, title='Training cost'
+        )
+        hooks.on_train_begin(self)
         for i in range(iterations + 1):
+            hooks.on_iteration_start(self, i)
+            start = time.perf_counter()
             A1, A2 = self.forward_prop(X)
+            end = time.perf_counter()
+            hooks.on_forward(self, i, end - start)
             self.gradient_descent(X, Y, A1, A2, alpha)
-            cost.append(self.cost(Y, self.__A2))
-
-            if verbose is True and i % step == 0:
-                print("Cost after {} iterations: {}"
-                      .format(i, cost[i]))
-        if graph is True:
-            plt.plot(np.arange(0, iterations + 1), cost)
-            plt.title("Training cost")
-            plt.xlabel("iteration")
-            plt.ylabel("cost")
-            plt.show()
-
-        return self.evaluate(X, Y)
+            start = time.perf_counter()
+            hooks.on_backward(self, i, start - end)
+            cost = None
+            if hooks.wants_cost(i):
+                cost = self.cost(Y, self.__A2)
+                hooks.on_cost(self, i, time.perf_counter() - start)
+            hooks.on_iteration_end(self, i, cost)
+            if hooks.should_stop():
+                iterations = i
+                break
+
+        prediction, cost = self.evaluate(X, Y)
+        hooks.on_train_end(self, iterations, cost)
+        return prediction, cost
 
     @property
     def W1(self):
@@ -166,3 +205,11 @@ class NeuralNetwork:
     @property
     def A2(self):
         return self.__A2
+
+    @property
+    def optimizer(self):
+        return self.__optimizer
+
+    @property
+    def dtype(self):
+        return self.__dtype
@@ -2,19 +2,35 @@
 '''One hot encode'''
 import numpy as np
 
-def one_hot_encode(Y, classes):
-    '''converter a numeric label vector into a one hot matrix'''
+def one_hot_encode(Y, classes, dtype=np.float64, out=None, chunk_size=None):
+    '''converter a numeric label vector into a one hot matrix
+
+    dtype: type of the matrix (uint8, bool, float32...), ignored if out
+    is given
+    out: existing (classes, m) buffer written in place, then returned
+    chunk_size: number of labels read and written at a time, so that Y
+    can be a memory-mapped label file; None encodes everything at once'''
     if (
         Y is not None
     ) and (
-        type(Y) is np.ndarray
+        isinstance(Y, np.ndarray)
     ) and (
         type(classes) is int
     ):
         try:
-            oneMatrix = np.zeros((classes, Y.shape[0]))
-            oneMatrix[Y, np.arange(Y.shape[0])] = 1
-            return oneMatrix
+            m = Y.shape[0]
+            if out is None:
+                out = np.empty((classes, m), dtype=dtype)
+            elif out.shape != (classes, m):
+                return None
+            size = max(m if chunk_size is None else chunk_size, 1)
+            columns = np.arange(min(size, m))
+            for start in range(0, m, size):
+                labels = Y[start:start + size]
+                block = out[:, start:start + size]
+                block.fill(0)
+                block[labels, columns[:labels.shape[0]]] = 1
+            return out
         except Exception:
             return None
     else:
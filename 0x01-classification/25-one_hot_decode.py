@@ -2,16 +2,46 @@
 '''One hot encode'''
 import numpy as np
 
-def one_hot_decode(one_hot):
+def one_hot_decode(one_hot, k=1, out=None, chunk_size=None):
     '''converter a one-hot matrix
-    into a vector of labels'''
+    into a vector of labels
+
+    k: with k > 1, returns a (k, m) matrix of the k best labels of each
+    column, best first
+    out: existing np.intp buffer, (m,) or (k, m), written in place
+    chunk_size: number of columns decoded at a time, so that one_hot can
+    be memory-mapped; None decodes everything at once'''
     if (
-        type(one_hot) is np.ndarray
+        isinstance(one_hot, np.ndarray)
+    ) and (
+        one_hot.ndim == 2
+    ) and (
+        type(k) is int
     ) and (
-        len(one_hot.shape) is 2
+        1 <= k <= one_hot.shape[0]
     ):
         try:
-            return np.argmax(one_hot, axis=0)
+            classes, m = one_hot.shape
+            shape = (m,) if k == 1 else (k, m)
+            if out is None:
+                out = np.empty(shape, dtype=np.intp)
+            elif out.shape != shape:
+                return None
+            size = max(m if chunk_size is None else chunk_size, 1)
+            for start in range(0, m, size):
+                block = one_hot[:, start:start + size]
+                if k == 1:
+                    np.argmax(block, axis=0, out=out[start:start + size])
+                    continue
+                # k best classes without a full sort, then sort those k
+                top = np.argpartition(block, classes - k, axis=0)[-k:]
+                order = np.argsort(
+                    np.take_along_axis(block, top, axis=0), axis=0
+                )[::-1]
+                out[:, start:start + size] = np.take_along_axis(
+                    top, order, axis=0
+                )
+            return out
         except Exception:
             return None
     else:
@@ -1,15 +1,92 @@
 #!/usr/bin/env python3
 '''Deep Neural Network'''
 import numpy as np
-import matplotlib.pyplot as plt
+import json
+import os
 import pickle
+import struct
+import time
+import zlib
+build_callbacks = __import__('30-hooks').build_callbacks
+from_config = __import__('31-optimizers').from_config
+_one_hot_encode = __import__('24-one_hot_encode').one_hot_encode
+_one_hot_decode = __import__('25-one_hot_decode').one_hot_decode
+sparse_input = __import__('33-sparse_input')
+_matmul = sparse_input.matmul
+_matmul_transposed = sparse_input.matmul_transposed
+
+
+def _is_labels(Y):
+    '''Vrai si Y est un vecteur d'étiquettes entières (m,) plutôt
+    qu'une matrice one-hot (classes, m)'''
+    return (
+        isinstance(Y, np.ndarray) and Y.ndim == 1 and
+        np.issubdtype(Y.dtype, np.integer)
+    )
+
+
+def _sigmoid(Z):
+    '''Sigmoïde en place'''
+    np.negative(Z, out=Z)
+    np.exp(Z, out=Z)
+    Z += 1
+    np.reciprocal(Z, out=Z)
+
+
+def _sigmoid_derivative(A, out):
+    '''Dérivée de la sigmoïde à partir de sa sortie A'''
+    np.subtract(1, A, out=out)
+    out *= A
+
+
+def _tanh(Z):
+    '''Tangente hyperbolique en place'''
+    np.tanh(Z, out=Z)
+
+
+def _tanh_derivative(A, out):
+    '''Dérivée de tanh à partir de sa sortie A'''
+    np.square(A, out=out)
+    np.subtract(1, out, out=out)
+
+
+def _relu(Z):
+    '''ReLU en place'''
+    np.maximum(Z, 0, out=Z)
+
+
+def _relu_derivative(A, out):
+    '''Dérivée de ReLU à partir de sa sortie A'''
+    np.greater(A, 0, out=out)
+
+
+# registre des activations des couches cachées : nom -> (activation en
+# place, dérivée calculée dans out à partir de la sortie activée)
+ACTIVATIONS = {
+    'sig': (_sigmoid, _sigmoid_derivative),
+    'tanh': (_tanh, _tanh_derivative),
+    'relu': (_relu, _relu_derivative)
+}
+
+MAGIC = b'DNNB'
+VERSION = 1
+# préfixe : magic, version, taille et crc32 de l'en-tête JSON
+PREFIX = struct.Struct('<4sIII')
+ALIGNMENT = 64
 
 
 class DeepNeuralNetwork:
     '''Deep Neural Network définit un réseau de neurones profonds effectuant une classification binaire'''
 
-    def __init__(self, nx, layers, activation='sig'):
-        '''Constructeur de la classe'''
+    def __init__(
+        self, nx, layers, activation='sig', dtype=np.float64, optimizer=None,
+        checkpoint=None
+    ):
+        '''Constructeur de la classe ; activation est un nom de
+        ACTIVATIONS, ou une liste d'un nom par couche cachée ; optimizer
+        est un optimiseur de 31-optimizers, ou None pour W - alpha * dW ;
+        avec checkpoint=k, seules les activations des couches multiples de
+        k sont gardées et les autres sont recalculées à la rétropropagation'''
         if type(nx) != int:
             raise TypeError('nx must be an integer')
         elif nx < 1:
@@ -22,28 +99,275 @@ class DeepNeuralNetwork:
             min(layers) < 1
         ):
             raise TypeError("layers must be a list of positive integers")
-        elif activation != 'sig' and activation != 'tanh':
-            raise ValueError("activation must be 'sig' or 'tanh'")
+        elif DeepNeuralNetwork.__hidden_activations(
+            activation, layers
+        ) is None:
+            raise ValueError(
+                'activation must be one of {} or a list of them for each '
+                'hidden layer'.format(sorted(ACTIVATIONS))
+            )
+        elif not np.issubdtype(dtype, np.floating):
+            raise TypeError("dtype must be a floating point type")
+        elif optimizer is not None and not hasattr(optimizer, 'update'):
+            raise TypeError('optimizer must provide an update method')
+        elif checkpoint is not None and type(checkpoint) != int:
+            raise TypeError('checkpoint must be an integer')
+        elif checkpoint is not None and checkpoint < 1:
+            raise ValueError('checkpoint must be a positive integer')
         else:
-            self.__activation = activation
-            self.__L = len(layers)
-            self.__cache = {}
-            self.__weights = {
-                "W1": np.random.randn(
-                    layers[0], nx
-                ) * np.sqrt(2 / nx),
-                "b1": np.zeros((layers[0], 1))
-            }
-            for i in range(1, self.L):
-                self.weights[
-                    'W{}'.format(i + 1)
-                ] = np.random.randn(
-                        layers[i],
-                        layers[i - 1]
-                    ) * np.sqrt(2 / layers[i - 1])
-                self.weights[
-                    'b{}'.format(i + 1)
-                ] = np.zeros((layers[i], 1))
+            self.__build(nx, layers, activation, dtype)
+            self.__optimizer = optimizer
+            self.__checkpoint = checkpoint
+            for i in range(1, self.L + 1):
+                fan_in = nx if i == 1 else layers[i - 2]
+                self.__weights['W' + str(i)][...] = np.random.randn(
+                    layers[i - 1], fan_in
+                ) * np.sqrt(2 / fan_in)
+
+    def __build(self, nx, layers, activation, dtype):
+        '''Alloue les tampons du réseau, paramètres à zéro'''
+        self.__activation = activation
+        self.__activations = [
+            ACTIVATIONS[name]
+            for name in self.__hidden_activations(activation, layers)
+        ]
+        self.__L = len(layers)
+        self.__nx = nx
+        self.__layers = list(layers)
+        self.__cache = {}
+        self.__parameters = np.zeros(
+            self.__parameters_size(), dtype=dtype
+        )
+        self.__weights = self.__views(self.__parameters)
+        self.__gradients = np.zeros_like(self.__parameters)
+        self.__grads = self.__views(self.__gradients)
+        self.__step = np.zeros_like(self.__parameters)
+        self.__workspaces = {}
+        self.__optimizer = None
+        self.__checkpoint = None
+
+    @staticmethod
+    def __hidden_activations(activation, layers):
+        '''Liste des noms d'activation de chaque couche cachée, ou None
+        si activation n'est pas valide'''
+        if type(activation) == str:
+            activation = [activation] * (len(layers) - 1)
+        if (
+            type(activation) != list
+        ) or (
+            len(activation) != len(layers) - 1
+        ) or (
+            any(name not in ACTIVATIONS for name in activation)
+        ):
+            return None
+        return activation
+
+    def __shapes(self):
+        '''Formes (W, b) de chaque couche, dans l'ordre du tampon'''
+        shapes, fan_in = [], self.__nx
+        for nodes in self.__layers:
+            shapes.append(((nodes, fan_in), (nodes, 1)))
+            fan_in = nodes
+        return shapes
+
+    def __parameters_size(self):
+        '''Nombre total de poids et de biais du réseau'''
+        return sum(
+            w[0] * w[1] + b[0] for w, b in self.__shapes()
+        )
+
+    def __views(self, buffer):
+        '''Découpe un tampon plat en vues W1, b1, ..., WL, bL
+        sans copie'''
+        views, offset = {}, 0
+        for i, (w_shape, b_shape) in enumerate(self.__shapes(), 1):
+            size = w_shape[0] * w_shape[1]
+            views['W' + str(i)] = buffer[offset:offset + size].reshape(
+                w_shape
+            )
+            offset += size
+            views['b' + str(i)] = buffer[offset:offset + b_shape[0]].reshape(
+                b_shape
+            )
+            offset += b_shape[0]
+        return views
+
+    def bind_buffers(self, parameters=None, gradients=None):
+        '''Remplace le tampon plat des paramètres et/ou des gradients par
+        un tableau fourni (mémoire partagée, memmap, ...) de même forme et
+        de même type ; son contenu est conservé et les vues sont refaites'''
+        for buffer in (parameters, gradients):
+            if buffer is None:
+                continue
+            if (
+                buffer.shape != self.__parameters.shape
+            ) or (
+                buffer.dtype != self.dtype
+            ):
+                raise ValueError(
+                    'buffer must match the shape and dtype of parameters'
+                )
+        if parameters is not None:
+            self.__parameters = parameters
+            self.__weights.update(self.__views(parameters))
+        if gradients is not None:
+            self.__gradients = gradients
+            self.__grads.update(self.__views(gradients))
+
+    def __setstate__(self, state):
+        '''Rétablit les vues sur le tampon plat après le dépicklage ; un
+        ancien pickle, sans tampon plat, est recopié dans un tampon neuf'''
+        if '_DeepNeuralNetwork__parameters' not in state:
+            weights = state['_DeepNeuralNetwork__weights']
+            layers = [
+                weights['W' + str(i)].shape[0]
+                for i in range(1, len(weights) // 2 + 1)
+            ]
+            self.__build(
+                weights['W1'].shape[1], layers,
+                state.get('_DeepNeuralNetwork__activation', 'sig'),
+                weights['W1'].dtype
+            )
+            for key, value in weights.items():
+                self.__weights[key][...] = value
+            return
+        self.__dict__.update(state)
+        self.__weights = self.__views(self.__parameters)
+        self.__grads = self.__views(self.__gradients)
+        self.__activations = [
+            ACTIVATIONS[name] for name in self.__hidden_activations(
+                self.__activation, self.__layers
+            )
+        ]
+
+    def __getstate__(self):
+        '''Les espaces de travail et les fonctions d'activation ne sont
+        pas sauvegardés'''
+        state = self.__dict__.copy()
+        state['_DeepNeuralNetwork__workspaces'] = {}
+        state.pop('_DeepNeuralNetwork__activations', None)
+        return state
+
+    def __workspace(self, m):
+        '''Retourne les tampons d'activations et de deltas pour un lot
+        de m exemples, alloués une seule fois par taille de lot'''
+        workspace = self.__workspaces.get(m)
+        if workspace is None:
+            if len(self.__workspaces) >= 4:
+                self.__workspaces.pop(next(iter(self.__workspaces)))
+            dtype = self.dtype
+            workspace = {'col': np.empty((1, m), dtype=dtype)}
+            if self.__checkpoint is None:
+                for i, nodes in enumerate(self.__layers, 1):
+                    for name in ('A', 'dZ', 'T'):
+                        workspace[name + str(i)] = np.empty(
+                            (nodes, m), dtype=dtype
+                        )
+            else:
+                self.__checkpoint_workspace(workspace, m)
+            self.__workspaces[m] = workspace
+        return workspace
+
+    def __checkpoint_workspace(self, workspace, m):
+        '''Espace de travail du mode checkpoint : seules les couches
+        gardées ont leur propre tampon ; les autres partagent k - 1 tampons
+        de segment, les deltas alternent entre deux tampons et les dérivées
+        utilisent un seul tampon'''
+        dtype, L, k = self.dtype, self.L, self.__checkpoint
+        hidden = max(self.__layers[:-1], default=0)
+        segments = [
+            np.empty(hidden * m, dtype=dtype) for _ in range(min(k, L) - 1)
+        ]
+        deltas = [
+            np.empty(max(self.__layers) * m, dtype=dtype)
+            for _ in range(min(L, 2))
+        ]
+        scratch = np.empty(hidden * m, dtype=dtype)
+        workspace['segment'] = None
+        for i, nodes in enumerate(self.__layers, 1):
+            size = nodes * m
+            if self.__is_stored(i):
+                workspace['A' + str(i)] = np.empty((nodes, m), dtype=dtype)
+            else:
+                workspace['A' + str(i)] = segments[i % k - 1][:size].reshape(
+                    nodes, m
+                )
+            workspace['dZ' + str(i)] = deltas[(L - i) % 2][:size].reshape(
+                nodes, m
+            )
+            if i == L:
+                workspace['T' + str(i)] = np.empty((nodes, m), dtype=dtype)
+            else:
+                workspace['T' + str(i)] = scratch[:size].reshape(nodes, m)
+
+    def __columns(self, workspace, m):
+        '''Indices 0..m-1 des colonnes, créés une seule fois par espace
+        de travail pour l'indexation par étiquettes'''
+        index = workspace.get('index')
+        if index is None:
+            index = workspace['index'] = np.arange(m)
+        return index
+
+    def __delta(self, A, Y, workspace):
+        '''Écrit le delta de sortie A - Y dans l'espace de travail ; si Y
+        est un vecteur d'étiquettes, 1 est soustrait à la probabilité de
+        la bonne classe sans construire de matrice one-hot'''
+        dZ = workspace['dZ' + str(self.L)]
+        if _is_labels(Y):
+            np.copyto(dZ, A)
+            dZ[Y, self.__columns(workspace, A.shape[1])] -= 1
+        else:
+            np.subtract(A, self.__as_dtype(Y), out=dZ)
+
+    def __is_stored(self, i):
+        '''Vrai si l'activation de la couche i est gardée dans le cache'''
+        k = self.__checkpoint
+        return k is None or i == self.L or i % k == 0
+
+    def __recompute(self, j, cache, workspace):
+        '''Retourne l'activation de la couche j non gardée, en recalculant
+        son segment depuis le dernier point de contrôle si besoin'''
+        k = self.__checkpoint
+        base = j - j % k
+        if workspace['segment'] != base:
+            A = cache['A' + str(base)]
+            for i in range(base + 1, min(base + k, self.L)):
+                Z = workspace['A' + str(i)]
+                _matmul(self.weights['W' + str(i)], A, Z)
+                Z += self.weights['b' + str(i)]
+                self.__activations[i - 1][0](Z)
+                A = Z
+            workspace['segment'] = base
+        return workspace['A' + str(j)]
+
+    def checkpoint_report(self, m):
+        '''Compare pour un lot de m exemples la mémoire des tampons de
+        propagation avec et sans checkpointing, et compte les couches
+        recalculées à chaque rétropropagation'''
+        layers, L = self.__layers, self.L
+        full = 3 * sum(layers) + 1
+        k = self.__checkpoint
+        if k is None:
+            used, recomputed = full, 0
+        else:
+            hidden = max(layers[:-1], default=0)
+            top = (L - 1) - (L - 1) % k
+            used = (
+                sum(layers[i - 1] for i in range(1, L) if i % k == 0) +
+                2 * layers[-1] + (min(k, L) - 1) * hidden +
+                min(L, 2) * max(layers) + hidden + 1
+            )
+            recomputed = sum(
+                1 for i in range(1, L) if i % k and i - i % k != top
+            )
+        itemsize = self.dtype.itemsize
+        return {
+            'checkpoint': k,
+            'workspace_bytes': used * m * itemsize,
+            'workspace_bytes_without_checkpoint': full * m * itemsize,
+            'recomputed_layers': recomputed,
+            'forward_layers': L
+        }
 
     @property
     def L(self):
@@ -60,39 +384,149 @@ class DeepNeuralNetwork:
         '''weights'''
         return self.__weights
 
+    @property
+    def parameters(self):
+        '''tampon plat contigu de tous les poids et biais'''
+        return self.__parameters
+
+    @property
+    def gradients(self):
+        '''tampon plat des gradients de la dernière rétropropagation'''
+        return self.__gradients
+
+    @property
+    def dtype(self):
+        '''type flottant des poids et de tous les calculs'''
+        return self.__parameters.dtype
+
+    @property
+    def checkpoint(self):
+        '''intervalle entre les couches gardées, ou None'''
+        return self.__checkpoint
+
+    @property
+    def optimizer(self):
+        '''optimiseur utilisé par apply_gradients, ou None'''
+        return self.__optimizer
+
     @property
     def activation(self):
         '''activation'''
         return self.__activation
 
     def forward_prop(self, X):
-        '''Calculates the forward'''
-        self.__cache['A0'] = X
-        for i in range(1, self.L + 1):
-            if self.activation == 'sig':
-                self.__cache[
-                    'A' + str(i)
-                ] = self.sigmoid(
-                        self.__cache['A'+str(i - 1)],
-                        self.weights['W'+str(i)],
-                        self.weights['b'+str(i)]
-                    )
-            if self.activation == 'tanh':
-                self.__cache[
-                    'A' + str(i)
-                ] = self.sigmoid(
-                        self.__cache['A'+str(i - 1)],
-                        self.weights['W'+str(i)],
-                        self.weights['b'+str(i)]
-                    )
-        self.__cache[
-            'A' + str(self.L)
-        ] = self.softmax(
-                self.__cache['A'+str(self.L - 1)],
-                self.weights['W'+str(self.L)],
-                self.weights['b'+str(self.L)]
-            )
-        return self.cache['A' + str(self.L)], self.cache
+        '''Calculates the forward
+
+        Les activations retournées sont des copies : les tampons réutilisés
+        par taille de lot restent réservés à l'entraînement.'''
+        self.__forward(X)
+        self.__cache.update(
+            (key, A.copy()) for key, A in self.__cache.items() if key != 'A0'
+        )
+        cache = dict(self.__cache)
+        return cache['A' + str(self.L)], cache
+
+    def __forward(self, X, Y=None):
+        '''Propagation avant ; si Y est donné, la couche de sortie
+        calcule aussi le delta A - Y dans la même passe'''
+        X = self.__as_dtype(X)
+        workspace = self.__workspace(X.shape[1])
+        self.__cache['A0'] = A = X
+        for i in range(1, self.L):
+            Z = workspace['A' + str(i)]
+            _matmul(self.weights['W' + str(i)], A, Z)
+            Z += self.weights['b' + str(i)]
+            self.__activations[i - 1][0](Z)
+            if self.__is_stored(i):
+                self.__cache['A' + str(i)] = Z
+            A = Z
+        if self.__checkpoint is not None:
+            top = self.L - 1
+            workspace['segment'] = top - top % self.__checkpoint
+        self.__softmax_cross_entropy(A, workspace, Y)
+
+    @staticmethod
+    def __chunk(chunk_size, m):
+        '''Valide chunk_size et retourne la largeur des blocs pour m
+        colonnes, avant toute allocation'''
+        if type(chunk_size) != int:
+            raise TypeError('chunk_size must be an integer')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+        return max(min(chunk_size, m), 1)
+
+    def __logits(self, X, chunk):
+        '''Génère (début, logits) par blocs de chunk colonnes (validé par
+        __chunk), sans remplir le cache, avec deux tampons alternés : les
+        logits d'un bloc sont écrasés par le bloc suivant'''
+        m = X.shape[1]
+        width = max(self.__layers)
+        buffers = (
+            np.empty(width * chunk, dtype=self.dtype),
+            np.empty(width * chunk, dtype=self.dtype)
+        )
+        for start in range(0, m, chunk):
+            A = self.__as_dtype(X[:, start:start + chunk])
+            size = A.shape[1]
+            for i in range(1, self.L + 1):
+                nodes = self.__layers[i - 1]
+                Z = buffers[i % 2][:nodes * size].reshape(nodes, size)
+                _matmul(self.weights['W' + str(i)], A, Z)
+                Z += self.weights['b' + str(i)]
+                if i < self.L:
+                    self.__activations[i - 1][0](Z)
+                A = Z
+            yield start, A
+
+    def predict(self, X, chunk_size=1024, out=None):
+        '''Calcule la sortie du réseau sans remplir le cache, par blocs
+        de chunk_size colonnes et avec deux tampons alternés ; écrit
+        dans out s'il est fourni, de forme (classes, m)'''
+        m = X.shape[1]
+        classes = self.__layers[-1]
+        if out is None:
+            out = np.empty((classes, m), dtype=self.dtype)
+        elif out.shape != (classes, m):
+            raise ValueError('out must have shape {}'.format((classes, m)))
+        chunk = self.__chunk(chunk_size, m)
+        col = np.empty((1, chunk), dtype=self.dtype)
+        for start, A in self.__logits(X, chunk):
+            size = A.shape[1]
+            # softmax stable de la couche de sortie, écrit dans out
+            scale = col[:, :size]
+            np.max(A, axis=0, keepdims=True, out=scale)
+            A -= scale
+            np.exp(A, out=A)
+            np.sum(A, axis=0, keepdims=True, out=scale)
+            np.divide(A, scale, out=out[:, start:start + size])
+        return out
+
+    def __as_dtype(self, array):
+        '''Convertit explicitement les entrées au type du réseau pour
+        qu'aucun calcul ne soit promu silencieusement en float64'''
+        if array.dtype != self.dtype:
+            return array.astype(self.dtype)
+        return array
+
+    def __softmax_cross_entropy(self, A_prev, workspace, Y=None):
+        '''Couche de sortie fusionnée : calcule les logits une seule fois,
+        un softmax stable (log-sum-exp) dont les log-probabilités restent
+        dans l'espace de travail pour cost(), et, si Y est donné, le
+        delta A - Y'''
+        L = str(self.L)
+        A, log_A, col = workspace['A' + L], workspace['T' + L], workspace['col']
+        _matmul(self.weights['W' + L], A_prev, log_A)
+        log_A += self.weights['b' + L]
+        np.max(log_A, axis=0, keepdims=True, out=col)
+        log_A -= col
+        np.exp(log_A, out=A)
+        np.sum(A, axis=0, keepdims=True, out=col)
+        A /= col
+        np.log(col, out=col)
+        log_A -= col
+        self.__cache['A' + L] = A
+        if Y is not None:
+            self.__delta(A, Y, workspace)
 
     def sigmoid(self, X=None, w=None, b=None, x=None):
         '''Sigmoid function'''
@@ -107,18 +541,10 @@ class DeepNeuralNetwork:
 
     def softmax(self, X=None, w=None, b=None, x=None):
         ''' Softmax function '''
-        if x:
-            return np.exp(x) / (np.sum(np.exp(x), axis=0))
-        else:
-            return np.exp(
-                np.add(
-                    np.matmul(w, X), b)
-            ) / (
-                np.sum(
-                    np.exp(np.add(np.matmul(w, X), b)),
-                    axis=0
-                )
-            )
+        if x is None:
+            x = np.add(np.matmul(w, X), b)
+        e = np.exp(x - np.max(x, axis=0, keepdims=True))
+        return e / np.sum(e, axis=0, keepdims=True)
 
     def tanh(self, X=None, w=None, b=None, x=None):
         ''' Tanh function '''
@@ -143,107 +569,211 @@ class DeepNeuralNetwork:
             )
 
     def cost(self, Y, A):
-        '''Calcule le coût (cost) du modèle à l'aide de la régression logistique'''
+        '''Calcule le coût (cost) du modèle à l'aide de la régression logistique ;
+        Y est une matrice one-hot (classes, m) ou un vecteur d'étiquettes
+        entières (m,)'''
         m = A.shape[1]
+        workspace = self.__workspaces.get(m)
+        if workspace is not None and A is workspace['A' + str(self.L)]:
+            # sortie de la dernière propagation : log-softmax déjà stable
+            log_A = workspace['T' + str(self.L)]
+            if _is_labels(Y):
+                return -np.sum(log_A[Y, self.__columns(workspace, m)]) / m
+            return -np.einsum('ij,ij->', self.__as_dtype(Y), log_A) / m
+        if _is_labels(Y):
+            A = A[Y, np.arange(m)]
+            return -np.sum(np.log(np.maximum(A, np.finfo(A.dtype).tiny))) / m
+        Y = self.__as_dtype(Y)
         return np.sum(
-            -Y * np.log(A)
+            -Y * np.log(np.maximum(A, np.finfo(A.dtype).tiny))
         ) / m
 
-    def one_hot_encode(Y, classes):
+    @staticmethod
+    def one_hot_encode(Y, classes, dtype=np.float64, out=None,
+                       chunk_size=None):
         '''converts a numeric label
-        vector into a one-hot matrix'''
-        if (
-            Y is not None
-        ) and (
-            type(Y) is np.ndarray
-        ) and (
-            type(classes) is int
-        ):
-            try:
-                oneMatrix = np.zeros((classes, Y.shape[0]))
-                oneMatrix[Y, np.arange(Y.shape[0])] = 1
-                return oneMatrix
-            except Exception:
-                return None
-        else:
-            return None
+        vector into a one-hot matrix (see 24-one_hot_encode)'''
+        return _one_hot_encode(Y, classes, dtype, out, chunk_size)
 
-    def one_hot_decode(one_hot):
+    @staticmethod
+    def one_hot_decode(one_hot, k=1, out=None, chunk_size=None):
         '''converts a one-hot matrix
-        into a vector of labels'''
-        if (
-            type(one_hot) is np.ndarray
-        ) and (
-            len(one_hot.shape) is 2
-        ):
-            try:
-                return np.argmax(one_hot, axis=0)
-            except Exception:
-                return None
-        else:
-            return None
+        into a vector of labels (see 25-one_hot_decode)'''
+        return _one_hot_decode(one_hot, k, out, chunk_size)
 
     def evaluate(self, X, Y):
-        '''Évalue les prédictions du neurone'''
+        '''Évalue les prédictions du neurone ; si Y est un vecteur
+        d'étiquettes entières, les prédictions sont aussi des étiquettes'''
         A = self.forward_prop(X)[0]
         cost = self.cost(Y, A)
+        if _is_labels(Y):
+            return (np.argmax(A, axis=0), cost)
         oneDecode = self.one_hot_decode(A)
-        A = self.one_hot_encode(oneDecode, Y.shape[0])
-        return (A.astype(int), cost)
+        A = self.one_hot_encode(oneDecode, Y.shape[0], dtype=int)
+        return (A, cost)
+
+    def evaluate_labels(self, X, Y, chunk_size=1024):
+        '''Évaluation rapide par blocs de chunk_size colonnes, sans
+        matrice one-hot : Y est un vecteur d'étiquettes (m,) ou une
+        matrice one-hot (classes, m) ; retourne un dictionnaire avec les
+        étiquettes prédites, l'exactitude, la précision et le rappel par
+        classe et la matrice de confusion (lignes : vraies classes,
+        colonnes : classes prédites)'''
+        m = X.shape[1]
+        classes = self.__layers[-1]
+        labels = np.empty(m, dtype=np.intp)
+        confusion = np.zeros(classes * classes, dtype=np.int64)
+        chunk = self.__chunk(chunk_size, m)
+        codes = np.empty(chunk, dtype=np.intp)
+        for start, A in self.__logits(X, chunk):
+            size = A.shape[1]
+            # le softmax ne change pas l'argmax : les logits suffisent
+            predicted = np.argmax(A, axis=0, out=labels[start:start + size])
+            true = Y[..., start:start + size]
+            code = codes[:size]
+            if _is_labels(true):
+                np.multiply(true, classes, out=code)
+            else:
+                np.argmax(true, axis=0, out=code)
+                code *= classes
+            code += predicted
+            confusion += np.bincount(code, minlength=classes * classes)
+        confusion = confusion.reshape(classes, classes)
+        hits = np.diagonal(confusion)
+        predicted, actual = confusion.sum(axis=0), confusion.sum(axis=1)
+        return {
+            'labels': labels,
+            'accuracy': hits.sum() / m,
+            'precision': np.divide(
+                hits, predicted, out=np.zeros(classes), where=predicted > 0
+            ),
+            'recall': np.divide(
+                hits, actual, out=np.zeros(classes), where=actual > 0
+            ),
+            'confusion': confusion
+        }
 
     def gradient_descent(self, Y, cache, alpha=0.05):
         '''Calcule une passe de descente de gradient sur le réseau neuronal profond'''
 
-        weight_copy = self.weights.copy()
-        dzi = np.subtract(
-            self.cache['A' + str(self.L)], Y
-        )
+        self.backward(Y, cache)
+        self.apply_gradients(alpha)
+
+    def apply_gradients(self, alpha=0.05):
+        '''Met à jour les paramètres en place à partir du tampon
+        gradients'''
+        if self.__optimizer is not None:
+            self.__optimizer.update(
+                [self.__parameters], [self.__gradients], alpha
+            )
+            return
+        np.multiply(self.__gradients, alpha, out=self.__step)
+        self.__parameters -= self.__step
+
+    def backward(self, Y, cache):
+        '''Calcule les gradients de toutes les couches dans le tampon
+        plat gradients, sans allocation une fois les tampons créés'''
+        A = cache['A' + str(self.L)]
+        m = A.shape[1]
+        self.__delta(A, Y, self.__workspace(m))
+        self.__backpropagate(cache, m)
+
+    def compute_gradients(self, X, Y):
+        '''Propagation et rétropropagation fusionnées, sans mise à jour :
+        les gradients sont écrits dans le tampon plat gradients et les
+        activations restent dans les espaces de travail, sans copie ;
+        retourne le coût, calculé sur le log-softmax de la passe'''
+        self.__forward(X, Y)
+        self.__backpropagate(self.__cache, Y.shape[-1])
+        return self.cost(Y, self.__cache['A' + str(self.L)])
+
+    def __backpropagate(self, cache, m):
+        '''Rétropropage le delta de sortie déjà calculé dans l'espace
+        de travail'''
+        workspace = self.__workspace(m)
+        dzi = workspace['dZ' + str(self.L)]
         for i in reversed(range(1, self.L + 1)):
-            b = weight_copy['b' + str(i)]
-            if i == self.L:
-                np.subtract(
-                    self.cache['A' + str(self.L)], Y
-                )
+            if self.__is_stored(i - 1):
+                A_prev = cache['A' + str(i - 1)]
             else:
-                w = weight_copy['W' + str(i + 1)]
-                if self.activation == 'sig':
-                    dzi = np.multiply(
-                        (
-                            self.cache[
-                                'A' + str(i)
-                            ] * (
-                                1 - self.cache['A' + str(i)]
-                            )
-                        ), np.matmul(w.T, dzi)
-                    )
-                if self.activation == 'tanh':
-                    dzi = np.multiply(
-                        (
-                            1 - (
-                                self.cache['A' + str(i)] ** 2
-                            )
-                        ), np.matmul(w.T, dzi)
-                    )
-            self.__weights['b' + str(i)] = weight_copy[
-                'b' + str(i)
-            ] - alpha * np.mean(
-                    dzi, axis=1, keepdims=True
-            )
-            self.__weights['W' + str(i)] = weight_copy[
-                'W' + str(i)
-            ] - alpha * np.matmul(
-                    dzi, self.cache['A' + str(i - 1)].T
-            ) / Y.shape[1]
+                A_prev = self.__recompute(i - 1, cache, workspace)
+            dw = self.__grads['W' + str(i)]
+            db = self.__grads['b' + str(i)]
+            _matmul_transposed(dzi, A_prev, dw)
+            dw /= m
+            np.sum(dzi, axis=1, keepdims=True, out=db)
+            db /= m
+            if i > 1:
+                dz_prev = workspace['dZ' + str(i - 1)]
+                derivative = workspace['T' + str(i - 1)]
+                np.matmul(self.weights['W' + str(i)].T, dzi, out=dz_prev)
+                self.__activations[i - 2][1](A_prev, derivative)
+                dz_prev *= derivative
+                dzi = dz_prev
+
+    def __train_step(self, X, Y, alpha, want_cost, times):
+        '''Une itération fusionnée : propagation, rétropropagation et
+        mise à jour ; cumule les durées des phases dans times et retourne
+        le coût avant la mise à jour s'il est demandé, sinon None'''
+        start = time.perf_counter()
+        self.__forward(X, Y)
+        end = time.perf_counter()
+        times[0] += end - start
+        self.__backpropagate(self.__cache, Y.shape[-1])
+        self.apply_gradients(alpha)
+        start = time.perf_counter()
+        times[1] += start - end
+        if not want_cost:
+            return None
+        cost = self.cost(Y, self.__cache['A' + str(self.L)])
+        times[2] += time.perf_counter() - start
+        return cost
+
+    def __notify(self, hooks, i, times, cost):
+        '''Transmet aux callbacks les durées et le coût d'une itération'''
+        hooks.on_forward(self, i, times[0])
+        hooks.on_backward(self, i, times[1])
+        if cost is not None:
+            hooks.on_cost(self, i, times[2])
+        hooks.on_iteration_end(self, i, cost)
+
+    @staticmethod
+    def mini_batches(X, Y=None, batch_size=32, shuffle=False):
+        '''Génère les mini-lots (X, Y) à partir de tableaux en mémoire
+        ou d'un itérable de morceaux (X_chunk, Y_chunk)'''
+        if Y is None:
+            chunks = X() if callable(X) else X
+        else:
+            chunks = ((X, Y),)
+        for X_chunk, Y_chunk in chunks:
+            m = X_chunk.shape[1]
+            order = np.random.permutation(m) if shuffle else None
+            for start in range(0, m, batch_size):
+                if order is None:
+                    batch = slice(start, start + batch_size)
+                else:
+                    batch = order[start:start + batch_size]
+                yield X_chunk[:, batch], Y_chunk[..., batch]
 
     def train(
-        self, X, Y,
+        self, X, Y=None,
         iterations=5000,
         alpha=0.05,
         verbose=True,
         graph=True,
-        step=100
+        step=100,
+        batch_size=None,
+        epochs=1,
+        shuffle=False,
+        callbacks=None
     ):
-        '''Entraîne le neurone'''
+        '''Entraîne le neurone ; les callbacks (30-hooks) sont notifiés à
+        chaque phase et le coût n'est calculé que s'ils le demandent'''
+        if batch_size is not None or Y is None:
+            return self.__train_mini_batch(
+                X, Y, epochs, alpha, verbose, graph, step,
+                batch_size, shuffle, callbacks
+            )
         if type(iterations) != int:
             raise TypeError('iterations must be an integer')
         if iterations < 0:
@@ -257,44 +787,200 @@ class DeepNeuralNetwork:
                 raise TypeError('step must be an integer')
             if (step < 0) or (step > iterations):
                 raise ValueError('step must be positive and <= iterations')
-        allCost, stepper = [], 0
+        hooks = build_callbacks(
+            verbose, graph, step, callbacks, final=True
+        )
+        hooks.on_train_begin(self)
         for i in range(iterations):
-            self.gradient_descent(Y, self.forward_prop(X)[1], alpha)
-            allCost.append(self.cost(Y, self.cache['A' + str(self.L)]))
-            if verbose and (i - 1 == stepper - 1):
-                print(
-                    'Cost after {} iterations: {}'.format(
-                        i, allCost[i]
-                    )
+            hooks.on_iteration_start(self, i)
+            times = [0.0, 0.0, 0.0]
+            cost = self.__train_step(X, Y, alpha, hooks.wants_cost(i), times)
+            self.__notify(hooks, i, times, cost)
+            if hooks.should_stop():
+                iterations = i + 1
+                break
+        evaluation, cost = self.evaluate(X, Y)
+        hooks.on_train_end(self, iterations, cost)
+        return (evaluation, cost)
+
+    def __train_mini_batch(
+        self, X, Y, epochs, alpha, verbose, graph, step,
+        batch_size, shuffle, callbacks
+    ):
+        '''Entraîne le réseau par descente de gradient par mini-lots,
+        sur des tableaux en mémoire ou sur un flux de morceaux'''
+        if batch_size is None:
+            batch_size = 32
+        if type(batch_size) != int:
+            raise TypeError('batch_size must be an integer')
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        if type(epochs) != int:
+            raise TypeError('epochs must be an integer')
+        if epochs < 1:
+            raise ValueError('epochs must be a positive integer')
+        if Y is None and epochs > 1 and not callable(X) and iter(X) is X:
+            # un générateur est épuisé après la première époque
+            raise TypeError(
+                'X must be a callable returning the chunks when epochs > 1'
+            )
+        if type(alpha) != float:
+            raise TypeError('alpha must be a float')
+        if alpha < 0:
+            raise ValueError('alpha must be positive')
+        if verbose or graph:
+            if type(step) != int:
+                raise TypeError('step must be an integer')
+            if step < 1:
+                raise ValueError('step must be positive')
+            # le pas par défaut, compté en itérations, est ramené au
+            # nombre d'époques
+            step = min(step, epochs)
+        hooks = build_callbacks(
+            verbose, graph, step, callbacks, 'epochs', final=verbose
+        )
+        hooks.on_train_begin(self)
+        for epoch in range(epochs):
+            hooks.on_iteration_start(self, epoch)
+            # sans Y, le coût moyen de la dernière époque est retourné
+            want_cost = hooks.wants_cost(epoch) or (
+                Y is None and epoch == epochs - 1
+            )
+            times, total, seen = [0.0, 0.0, 0.0], 0, 0
+            for X_batch, Y_batch in self.mini_batches(
+                X, Y, batch_size, shuffle
+            ):
+                cost = self.__train_step(
+                    X_batch, Y_batch, alpha, want_cost, times
                 )
-                stepper += step
+                if want_cost:
+                    total += cost * X_batch.shape[1]
+                    seen += X_batch.shape[1]
+            cost = total / seen if want_cost and seen else None
+            self.__notify(hooks, epoch, times, cost)
+            if hooks.should_stop():
+                epochs = epoch + 1
+                break
+        if Y is None:
+            hooks.on_train_end(self, epochs, cost)
+            return (None, cost)
         evaluation, cost = self.evaluate(X, Y)
-        i += 1
-        print("Cost after {} iterations: {}".format(i, cost))
-        if graph:
-            plt.plot(allCost)
-            plt.xlabel('iteration')
-            plt.ylabel('cost')
-            plt.title('Training Cost')
-            plt.show()
+        hooks.on_train_end(self, epochs, cost)
         return (evaluation, cost)
 
     def save(self, filename):
-        '''Enregistre l'objet d'instance dans un fichier au format pickle'''
+        '''Enregistre le réseau dans un fichier binaire versionné (.dnn) :
+        un en-tête JSON avec l'architecture, puis les tableaux bruts
+        alignés, chacun avec sa somme de contrôle ; le cache n'est pas
+        sauvegardé ; l'état de l'optimiseur est enregistré avec le réseau ;
+        .dnn n'est ajouté qu'à un nom sans extension, une extension donnée
+        (.pkl...) est gardée'''
         if type(filename) is str:
-            if filename[-4:] != '.pkl':
-                filename += '.pkl'
+            if not os.path.splitext(filename)[1]:
+                filename += '.dnn'
+            arrays = {'parameters': self.__parameters}
+            header = {
+                'nx': self.__nx,
+                'layers': self.__layers,
+                'activation': self.__activation,
+                'dtype': self.dtype.newbyteorder('<').str,
+                'optimizer': None,
+                'checkpoint': self.__checkpoint,
+                'arrays': {}
+            }
+            if self.__optimizer is not None:
+                header['optimizer'] = {
+                    'name': type(self.__optimizer).__name__,
+                    'config': self.__optimizer.config()
+                }
+                for name, array in self.__optimizer.state_dict().items():
+                    arrays['optimizer.' + name] = array
+            # décalages relatifs au début des données, qui suivent
+            # l'en-tête complété jusqu'à un multiple de ALIGNMENT
+            start = 0
+            for name, array in arrays.items():
+                start += -start % ALIGNMENT
+                header['arrays'][name] = {
+                    'offset': start,
+                    'shape': list(array.shape),
+                    'dtype': array.dtype.newbyteorder('<').str,
+                    'crc32': zlib.crc32(np.ascontiguousarray(array))
+                }
+                start += array.nbytes
+            encoded = json.dumps(header).encode('utf-8')
+            encoded += b' ' * (-(PREFIX.size + len(encoded)) % ALIGNMENT)
+            base = PREFIX.size + len(encoded)
             with open(filename, 'wb') as file:
-                pickle.dump(self, file)
+                file.write(PREFIX.pack(
+                    MAGIC, VERSION, len(encoded), zlib.crc32(encoded)
+                ))
+                file.write(encoded)
+                for name, array in arrays.items():
+                    file.seek(base + header['arrays'][name]['offset'])
+                    file.write(np.ascontiguousarray(
+                        array, dtype=header['arrays'][name]['dtype']
+                    ))
         else:
             return None
 
     @staticmethod
-    def load(filename):
-        '''Loads a pickled
-        DeepNeuralNetwork object'''
+    def load(filename, mmap=False, verify=True):
+        '''Charge un DeepNeuralNetwork enregistré par save ; avec mmap,
+        les paramètres sont projetés en mémoire (copie à l'écriture) et
+        partagés entre processus ; les anciens fichiers pickle restent
+        lisibles. Avec verify, le CRC des paramètres lit toutes les pages
+        du fichier : verify=False garde le chargement paresseux de mmap ;
+        un nom sans extension est aussi cherché avec .dnn, comme save'''
+        if (
+            type(filename) is str and not os.path.exists(filename) and
+            os.path.exists(filename + '.dnn')
+        ):
+            filename += '.dnn'
         try:
             with open(filename, 'rb') as file:
-                return pickle.load(file)
+                prefix = file.read(PREFIX.size)
+                if prefix[:4] != MAGIC:
+                    file.seek(0)
+                    return pickle.load(file)
+                magic, version, size, crc = PREFIX.unpack(prefix)
+                encoded = file.read(size)
+            if version != VERSION or zlib.crc32(encoded) != crc:
+                return None
+            header = json.loads(encoded.decode('utf-8'))
+            network = DeepNeuralNetwork.__new__(DeepNeuralNetwork)
+            network.__build(
+                header['nx'], header['layers'],
+                header['activation'], np.dtype(header['dtype'])
+            )
+            arrays = {}
+            for name, entry in header['arrays'].items():
+                dtype = entry.get('dtype', header['dtype'])
+                offset = PREFIX.size + size + entry['offset']
+                if mmap and name == 'parameters':
+                    array = np.memmap(
+                        filename, dtype=dtype, mode='c',
+                        offset=offset, shape=tuple(entry['shape'])
+                    )
+                else:
+                    array = np.fromfile(
+                        filename, dtype=dtype,
+                        count=int(np.prod(entry['shape'])), offset=offset
+                    ).reshape(entry['shape'])
+                if verify and zlib.crc32(array) != entry['crc32']:
+                    return None
+                arrays[name] = array
+            network.bind_buffers(parameters=arrays.pop('parameters'))
+            network.__checkpoint = header.get('checkpoint')
+            if header.get('optimizer'):
+                network.__optimizer = from_config(
+                    header['optimizer']['name'],
+                    header['optimizer']['config']
+                )
+                network.__optimizer.load_state_dict({
+                    name[len('optimizer.'):]: array
+                    for name, array in arrays.items()
+                    if name.startswith('optimizer.')
+                })
+            return network
         except Exception:
-            return None
\ No newline at end of file
+            return None
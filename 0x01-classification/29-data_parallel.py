@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+'''Entraînement data-parallèle d'un DeepNeuralNetwork sur plusieurs processus'''
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import time
+import numpy as np
+build_callbacks = __import__('30-hooks').build_callbacks
+
+
+def _shared(array, dtype):
+    '''Copie un tableau une seule fois dans une mémoire partagée et
+    retourne (mémoire, vue numpy)'''
+    array = np.asarray(array, dtype=dtype)
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=dtype, buffer=memory.buf)
+    view[...] = array
+    return memory, view
+
+
+def _attach(name, shape, dtype):
+    '''Ouvre une mémoire partagée existante sans copie'''
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _worker(conn, network, layout, index, start, stop):
+    '''Boucle d'un processus : calcule les gradients de son fragment de
+    colonnes à chaque demande du processus principal'''
+    memories, arrays = [], {}
+    for key, (name, shape, dtype) in layout.items():
+        memory, arrays[key] = _attach(name, shape, dtype)
+        memories.append(memory)
+    network.bind_buffers(
+        parameters=arrays['parameters'],
+        gradients=arrays['gradients'][index]
+    )
+    X = arrays['X'][:, start:stop]
+    Y = arrays['Y'][..., start:stop]
+    try:
+        while conn.recv():
+            conn.send(network.compute_gradients(X, Y))
+    finally:
+        network.cache.clear()
+        del X, Y, arrays
+        network.bind_buffers(
+            parameters=network.parameters.copy(),
+            gradients=network.gradients.copy()
+        )
+        for memory in memories:
+            memory.close()
+        conn.close()
+
+
+class DataParallelTrainer:
+    '''Répartit les colonnes de X / Y entre plusieurs processus qui
+    partagent les données et les paramètres en mémoire ; les gradients
+    sont additionnés (all-reduce) avant chaque mise à jour'''
+
+    def __init__(self, network, X, Y, workers=2):
+        '''Constructeur : copie X, Y et les paramètres une seule fois en
+        mémoire partagée et démarre les processus'''
+        if type(workers) != int:
+            raise TypeError('workers must be an integer')
+        if workers < 1:
+            raise ValueError('workers must be a positive integer')
+        m = X.shape[1]
+        if workers > m:
+            raise ValueError('workers must be <= the number of examples')
+        dtype = network.dtype
+        self.__network = network
+        self.__memories = {}
+        arrays = {}
+        # les étiquettes entières gardent leur type
+        labels = Y.dtype if Y.ndim == 1 else dtype
+        for key, array, kind in (
+            ('X', X, dtype), ('Y', Y, labels),
+            ('parameters', network.parameters, dtype),
+            ('gradients', np.zeros((workers,) + network.parameters.shape),
+             dtype)
+        ):
+            self.__memories[key], arrays[key] = _shared(array, kind)
+        layout = {
+            key: (self.__memories[key].name, arrays[key].shape,
+                  arrays[key].dtype)
+            for key in arrays
+        }
+        self.__parameters = arrays['parameters']
+        self.__gradients = arrays['gradients']
+        network.bind_buffers(parameters=self.__parameters)
+        bounds = np.linspace(0, m, workers + 1).astype(int)
+        # poids de chaque fragment : la moyenne globale est exacte
+        self.__shares = (np.diff(bounds) / m).astype(dtype)
+        self.__conns, self.__processes = [], []
+        for index in range(workers):
+            parent, child = mp.Pipe()
+            process = mp.Process(
+                target=_worker,
+                args=(
+                    child, network, layout, index,
+                    bounds[index], bounds[index + 1]
+                ),
+                daemon=True
+            )
+            process.start()
+            child.close()
+            self.__conns.append(parent)
+            self.__processes.append(process)
+
+    @property
+    def workers(self):
+        '''nombre de processus'''
+        return len(self.__processes)
+
+    def step(self, alpha=0.05):
+        '''Une itération de descente de gradient sur tout le lot ;
+        retourne le coût avant la mise à jour'''
+        for conn in self.__conns:
+            conn.send(True)
+        costs = np.array([conn.recv() for conn in self.__conns])
+        np.matmul(
+            self.__shares, self.__gradients, out=self.__network.gradients
+        )
+        self.__network.apply_gradients(alpha)
+        return float(np.dot(self.__shares, costs))
+
+    def train(self, iterations=5000, alpha=0.05, verbose=True, step=100,
+              callbacks=None):
+        '''Entraîne le réseau et retourne la liste des coûts ; les
+        callbacks (30-hooks) sont notifiés à chaque itération'''
+        if type(iterations) != int:
+            raise TypeError('iterations must be an integer')
+        if iterations < 1:
+            raise ValueError('iterations must be a positive integer')
+        if type(alpha) != float:
+            raise TypeError('alpha must be a float')
+        if alpha < 0:
+            raise ValueError('alpha must be positive')
+        if verbose:
+            if type(step) != int:
+                raise TypeError('step must be an integer')
+            if (step < 1) or (step > iterations):
+                raise ValueError('step must be positive and <= iterations')
+        hooks = build_callbacks(verbose, False, step, callbacks)
+        hooks.on_train_begin(self.__network)
+        allCost = []
+        for i in range(iterations):
+            hooks.on_iteration_start(self.__network, i)
+            allCost.append(self.step(alpha))
+            hooks.on_iteration_end(self.__network, i, allCost[i])
+            if hooks.should_stop():
+                break
+        hooks.on_train_end(self.__network, len(allCost), allCost[-1])
+        return allCost
+
+    def close(self):
+        '''Arrête les processus, rend au réseau une copie privée de ses
+        paramètres et libère la mémoire partagée'''
+        for conn, process in zip(self.__conns, self.__processes):
+            conn.send(False)
+            process.join()
+            conn.close()
+        self.__network.bind_buffers(parameters=self.__parameters.copy())
+        del self.__parameters, self.__gradients
+        for memory in self.__memories.values():
+            memory.close()
+            memory.unlink()
+        self.__conns, self.__processes, self.__memories = [], [], {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def scaling(network, X, Y, workers=(1, 2, 4), iterations=20, alpha=0.05):
+    '''Mesure le temps d'entraînement pour chaque nombre de processus, à
+    partir des mêmes paramètres initiaux ; retourne une liste de
+    dictionnaires (workers, seconds, speedup) par rapport au premier'''
+    initial = network.parameters.copy()
+    report = []
+    for count in workers:
+        network.parameters[...] = initial
+        with DataParallelTrainer(network, X, Y, count) as trainer:
+            trainer.step(alpha)
+            start = time.perf_counter()
+            trainer.train(iterations, alpha, verbose=False)
+            seconds = time.perf_counter() - start
+        report.append({
+            'workers': count,
+            'seconds': seconds,
+            'speedup': report[0]['seconds'] / seconds if report else 1.0
+        })
+    network.parameters[...] = initial
+    return report
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+'''Points d'accroche (callbacks) pour instrumenter les boucles train()'''
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class Callback:
+    '''Classe de base d'un callback : chaque événement est une méthode
+    vide à redéfinir ; les temps sont des durées en secondes'''
+
+    def wants_cost(self, iteration):
+        '''Indique si le coût doit être calculé à cette itération'''
+        return False
+
+    def should_stop(self):
+        '''Indique, après on_iteration_end, si l'entraînement doit
+        s'arrêter'''
+        return False
+
+    def on_train_begin(self, model):
+        '''Appelé avant la première itération'''
+
+    def on_iteration_start(self, model, iteration):
+        '''Appelé au début de chaque itération'''
+
+    def on_forward(self, model, iteration, seconds):
+        '''Appelé après la propagation avant'''
+
+    def on_backward(self, model, iteration, seconds):
+        '''Appelé après la rétropropagation et la mise à jour'''
+
+    def on_cost(self, model, iteration, seconds):
+        '''Appelé après le calcul du coût, s'il a été demandé'''
+
+    def on_iteration_end(self, model, iteration, cost):
+        '''Appelé à la fin de chaque itération ; cost vaut None si aucun
+        callback ne l'a demandé'''
+
+    def on_train_end(self, model, iteration, cost):
+        '''Appelé après l'entraînement avec le coût de l'évaluation
+        finale'''
+
+
+class CallbackList(Callback):
+    '''Diffuse chaque événement à une liste de callbacks'''
+
+    def __init__(self, callbacks=()):
+        '''Constructeur de la classe'''
+        self.callbacks = list(callbacks)
+
+    def wants_cost(self, iteration):
+        '''Vrai si au moins un callback demande le coût'''
+        return any(
+            callback.wants_cost(iteration) for callback in self.callbacks
+        )
+
+    def should_stop(self):
+        '''Vrai si au moins un callback demande l'arrêt'''
+        return any(callback.should_stop() for callback in self.callbacks)
+
+    def on_train_begin(self, model):
+        for callback in self.callbacks:
+            callback.on_train_begin(model)
+
+    def on_iteration_start(self, model, iteration):
+        for callback in self.callbacks:
+            callback.on_iteration_start(model, iteration)
+
+    def on_forward(self, model, iteration, seconds):
+        for callback in self.callbacks:
+            callback.on_forward(model, iteration, seconds)
+
+    def on_backward(self, model, iteration, seconds):
+        for callback in self.callbacks:
+            callback.on_backward(model, iteration, seconds)
+
+    def on_cost(self, model, iteration, seconds):
+        for callback in self.callbacks:
+            callback.on_cost(model, iteration, seconds)
+
+    def on_iteration_end(self, model, iteration, cost):
+        for callback in self.callbacks:
+            callback.on_iteration_end(model, iteration, cost)
+
+    def on_train_end(self, model, iteration, cost):
+        for callback in self.callbacks:
+            callback.on_train_end(model, iteration, cost)
+
+
+class PrintCost(Callback):
+    '''Affiche le coût toutes les step itérations (seulement à
+    l'itération 0 si step vaut 0, jamais s'il vaut None) ; avec final,
+    affiche aussi le coût de l'évaluation finale'''
+
+    def __init__(self, step=100, unit='iterations', final=False):
+        '''Constructeur de la classe'''
+        self.step = step
+        self.unit = unit
+        self.final = final
+
+    def wants_cost(self, iteration):
+        if self.step is None:
+            return False
+        if self.step == 0:
+            return iteration == 0
+        return iteration % self.step == 0
+
+    def on_iteration_end(self, model, iteration, cost):
+        if cost is not None and self.wants_cost(iteration):
+            print('Cost after {} {}: {}'.format(iteration, self.unit, cost))
+
+    def on_train_end(self, model, iteration, cost):
+        if self.final:
+            print('Cost after {} {}: {}'.format(iteration, self.unit, cost))
+
+
+class PlotCost(Callback):
+    '''Trace la courbe du coût, relevé toutes les step itérations'''
+
+    def __init__(self, step=1, unit='iteration', title='Training Cost'):
+        '''Constructeur de la classe'''
+        self.step = step
+        self.unit = unit
+        self.title = title
+        self.iterations = []
+        self.costs = []
+
+    def wants_cost(self, iteration):
+        return iteration % self.step == 0
+
+    def on_train_begin(self, model):
+        self.iterations, self.costs = [], []
+
+    def on_iteration_end(self, model, iteration, cost):
+        if cost is not None and iteration % self.step == 0:
+            self.iterations.append(iteration)
+            self.costs.append(cost)
+
+    def on_train_end(self, model, iteration, cost):
+        plt.plot(self.iterations, self.costs)
+        plt.xlabel(self.unit)
+        plt.ylabel('cost')
+        plt.title(self.title)
+        plt.show()
+
+
+class PhaseTimer(Callback):
+    '''Cumule le temps passé dans chaque phase (forward, backward, cost)'''
+
+    def __init__(self):
+        '''Constructeur de la classe'''
+        self.reset()
+
+    def reset(self):
+        '''Remet les compteurs à zéro'''
+        self.totals = {'forward': 0.0, 'backward': 0.0, 'cost': 0.0}
+        self.counts = {'forward': 0, 'backward': 0, 'cost': 0}
+
+    def on_forward(self, model, iteration, seconds):
+        self.totals['forward'] += seconds
+        self.counts['forward'] += 1
+
+    def on_backward(self, model, iteration, seconds):
+        self.totals['backward'] += seconds
+        self.counts['backward'] += 1
+
+    def on_cost(self, model, iteration, seconds):
+        self.totals['cost'] += seconds
+        self.counts['cost'] += 1
+
+    def report(self):
+        '''Retourne pour chaque phase le temps total, le nombre d'appels
+        et le temps moyen en secondes'''
+        return {
+            phase: {
+                'total': total,
+                'count': self.counts[phase],
+                'mean': total / max(self.counts[phase], 1)
+            } for phase, total in self.totals.items()
+        }
+
+
+class EarlyStopping(Callback):
+    '''Arrête l'entraînement quand le coût surveillé ne diminue plus de
+    plus de tol pendant patience vérifications ; le coût surveillé est
+    celui de validation = (X, Y) s'il est donné, sinon le coût
+    d'entraînement, relevé toutes les step itérations (époques en
+    mini-lots) ; les meilleurs poids sont gardés en mémoire et, avec
+    restore_best, remis en place à l'arrêt. Le coût d'entraînement
+    d'une itération est calculé avant sa mise à jour : les poids gardés
+    sont alors ceux du début de l'itération'''
+
+    def __init__(
+        self, tol=0.0, patience=10, validation=None, step=1,
+        restore_best=True
+    ):
+        '''Constructeur de la classe'''
+        if tol < 0:
+            raise ValueError('tol must be positive')
+        if type(patience) != int or patience < 1:
+            raise ValueError('patience must be a positive integer')
+        if type(step) != int or step < 1:
+            raise ValueError('step must be a positive integer')
+        self.tol = tol
+        self.patience = patience
+        self.validation = validation
+        self.step = step
+        self.restore_best = restore_best
+        self.on_train_begin(None)
+
+    def on_train_begin(self, model):
+        self.best_cost = np.inf
+        self.best_iteration = None
+        self.best_weights = None
+        self.stopped_iteration = None
+        self.__wait = 0
+        self.__pending = None
+
+    def wants_cost(self, iteration):
+        return self.validation is None and iteration % self.step == 0
+
+    def should_stop(self):
+        return self.stopped_iteration is not None
+
+    def on_iteration_start(self, model, iteration):
+        if self.wants_cost(iteration):
+            self.__pending = _snapshot(model, self.__pending)
+
+    def on_iteration_end(self, model, iteration, cost):
+        if iteration % self.step:
+            return
+        if self.validation is not None:
+            cost = model.evaluate(*self.validation)[1]
+        if cost is None:
+            return
+        if cost < self.best_cost - self.tol:
+            self.best_cost, self.best_iteration = cost, iteration
+            if self.validation is None:
+                # le tampon de l'ancien meilleur sert au prochain relevé
+                self.best_weights, self.__pending = (
+                    self.__pending, self.best_weights
+                )
+            else:
+                self.best_weights = _snapshot(model)
+            self.__wait = 0
+            return
+        self.__wait += 1
+        if self.__wait >= self.patience:
+            self.stopped_iteration = iteration
+            if self.restore_best:
+                self.restore(model)
+
+    def restore(self, model):
+        '''Remet en place les meilleurs poids relevés'''
+        if self.best_weights is not None:
+            _restore(model, self.best_weights)
+
+
+def _snapshot(model, out=None):
+    '''Copie les poids d'un modèle : le tampon plat parameters d'un
+    DeepNeuralNetwork, sinon W, b (Neuron) ou W1, b1, W2, b2
+    (NeuralNetwork) ; out, une copie précédente, est réutilisé'''
+    if isinstance(getattr(model, 'parameters', None), np.ndarray):
+        weights = {'parameters': model.parameters}
+    else:
+        weights = {
+            name: getattr(model, name)
+            for name in ('W', 'b', 'W1', 'b1', 'W2', 'b2')
+            if hasattr(type(model), name)
+        }
+    copies = {}
+    for name, value in weights.items():
+        value = np.asarray(value)
+        copy = None if out is None else out[name]
+        if (
+            copy is None or copy.shape != value.shape or
+            copy.dtype != value.dtype
+        ):
+            copy = np.empty_like(value)
+        np.copyto(copy, value)
+        copies[name] = copy
+    return copies
+
+
+def _restore(model, weights):
+    '''Remet en place des poids copiés par _snapshot ; le tampon plat est
+    réécrit en place pour garder ses vues valides'''
+    if 'parameters' in weights:
+        model.parameters[...] = weights['parameters']
+        return
+    for name, value in weights.items():
+        # attributs privés __W, __b... des classes Neuron / NeuralNetwork
+        setattr(
+            model, '_{}__{}'.format(type(model).__name__, name),
+            value.copy() if value.ndim else value[()]
+        )
+
+
+def build_callbacks(
+    verbose, graph, step, callbacks=None, unit='iterations',
+    title='Training Cost', final=False
+):
+    '''Construit la CallbackList d'une boucle train() : verbose et graph
+    ajoutent PrintCost et PlotCost aux callbacks fournis ; la courbe
+    garde toutes les itérations et final affiche le coût final même
+    sans verbose, comme les boucles d'origine'''
+    hooks = CallbackList(callbacks or ())
+    if verbose or final:
+        hooks.callbacks.append(
+            PrintCost(step if verbose else None, unit, final)
+        )
+    if graph:
+        hooks.callbacks.append(PlotCost(1, unit.rstrip('s'), title))
+    return hooks
+
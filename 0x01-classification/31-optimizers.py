@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+'''Optimiseurs (descente de gradient, momentum, RMSProp, Adam) pour les
+réseaux NumPy ; leur état est gardé dans des tampons alloués une fois'''
+import numpy as np
+
+
+class GradientDescent:
+    '''Descente de gradient simple : param -= alpha * grad'''
+
+    slots = ()
+
+    def __init__(self):
+        '''Constructeur de la classe'''
+        self.t = 0
+        self.state = None
+        self.__scratch = None
+
+    def config(self):
+        '''Hyperparamètres nécessaires pour recréer l'optimiseur'''
+        return {}
+
+    def update(self, params, grads, alpha):
+        '''Met à jour chaque paramètre avec son gradient et retourne la
+        liste des paramètres : les tableaux sont modifiés en place, les
+        scalaires sont remplacés'''
+        if self.state is None:
+            self.state = {
+                slot: [np.zeros(np.shape(g), dtype=np.asarray(g).dtype)
+                       for g in grads]
+                for slot in self.slots
+            }
+        if self.__scratch is None:
+            self.__scratch = [
+                np.zeros(np.shape(g), dtype=np.asarray(g).dtype)
+                for g in grads
+            ]
+        self.t += 1
+        updated = []
+        for i, (param, grad) in enumerate(zip(params, grads)):
+            step = self.__scratch[i]
+            self.direction(i, grad, alpha, step)
+            if isinstance(param, np.ndarray):
+                param -= step
+            else:
+                param = param - step[()]
+            updated.append(param)
+        return updated
+
+    def direction(self, i, grad, alpha, out):
+        '''Écrit dans out le pas à soustraire au paramètre i'''
+        np.multiply(grad, alpha, out=out)
+
+    def state_dict(self):
+        '''Retourne l'état sous forme {nom: tableau} pour la sauvegarde'''
+        state = {'t': np.array(self.t, dtype=np.int64)}
+        for slot, buffers in (self.state or {}).items():
+            for i, buffer in enumerate(buffers):
+                state['{}{}'.format(slot, i)] = buffer
+        return state
+
+    def load_state_dict(self, state):
+        '''Restaure un état produit par state_dict'''
+        self.t = int(state.get('t', 0))
+        count = 0
+        if self.slots:
+            count = sum(1 for name in state if name.startswith(self.slots[0]))
+        # sans tampons sauvegardés, ils sont alloués à la première mise à jour
+        self.state = None
+        if count:
+            self.state = {
+                slot: [state['{}{}'.format(slot, i)] for i in range(count)]
+                for slot in self.slots
+            }
+
+
+class Momentum(GradientDescent):
+    '''Descente de gradient avec momentum'''
+
+    slots = ('v',)
+
+    def __init__(self, beta1=0.9):
+        '''Constructeur de la classe'''
+        if not 0 <= beta1 < 1:
+            raise ValueError('beta1 must be in [0, 1)')
+        super().__init__()
+        self.beta1 = beta1
+
+    def config(self):
+        return {'beta1': self.beta1}
+
+    def direction(self, i, grad, alpha, out):
+        v = self.state['v'][i]
+        v *= self.beta1
+        np.multiply(grad, 1 - self.beta1, out=out)
+        v += out
+        np.multiply(v, alpha, out=out)
+
+
+class RMSProp(GradientDescent):
+    '''Optimisation RMSProp'''
+
+    slots = ('s',)
+
+    def __init__(self, beta2=0.9, epsilon=1e-8):
+        '''Constructeur de la classe'''
+        if not 0 <= beta2 < 1:
+            raise ValueError('beta2 must be in [0, 1)')
+        super().__init__()
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def config(self):
+        return {'beta2': self.beta2, 'epsilon': self.epsilon}
+
+    def direction(self, i, grad, alpha, out):
+        s = self.state['s'][i]
+        s *= self.beta2
+        np.square(grad, out=out)
+        out *= 1 - self.beta2
+        s += out
+        np.sqrt(s, out=out)
+        out += self.epsilon
+        np.divide(grad, out, out=out)
+        out *= alpha
+
+
+class Adam(GradientDescent):
+    '''Optimisation Adam, avec correction du biais'''
+
+    slots = ('v', 's')
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        '''Constructeur de la classe'''
+        if not 0 <= beta1 < 1:
+            raise ValueError('beta1 must be in [0, 1)')
+        if not 0 <= beta2 < 1:
+            raise ValueError('beta2 must be in [0, 1)')
+        super().__init__()
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def config(self):
+        return {
+            'beta1': self.beta1, 'beta2': self.beta2, 'epsilon': self.epsilon
+        }
+
+    def direction(self, i, grad, alpha, out):
+        v, s = self.state['v'][i], self.state['s'][i]
+        v *= self.beta1
+        np.multiply(grad, 1 - self.beta1, out=out)
+        v += out
+        s *= self.beta2
+        np.square(grad, out=out)
+        out *= 1 - self.beta2
+        s += out
+        np.divide(s, 1 - self.beta2 ** self.t, out=out)
+        np.sqrt(out, out=out)
+        out += self.epsilon
+        np.divide(v, out, out=out)
+        out *= alpha / (1 - self.beta1 ** self.t)
+
+
+OPTIMIZERS = {
+    optimizer.__name__: optimizer
+    for optimizer in (GradientDescent, Momentum, RMSProp, Adam)
+}
+
+
+def from_config(name, config):
+    '''Recrée un optimiseur à partir de son nom et de config()'''
+    return OPTIMIZERS[name](**config)
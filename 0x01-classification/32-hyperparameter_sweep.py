@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+'''Entraînement simultané de K Neuron ou NeuralNetwork (balayage de taux
+d'apprentissage ou de graines) : les poids des K modèles sont empilés et
+chaque couche ne fait qu'un produit matriciel pour tous les modèles'''
+import numpy as np
+_sigmoid = __import__('28-deep_neural_network')._sigmoid
+
+
+def build_models(cls, seeds, *args, **kwargs):
+    '''Crée un modèle cls(*args, **kwargs) par graine, chacun initialisé
+    après np.random.seed(graine)'''
+    models = []
+    for seed in seeds:
+        np.random.seed(seed)
+        models.append(cls(*args, **kwargs))
+    return models
+
+
+def _set(model, name, value):
+    '''Écrit l'attribut privé __name d'un Neuron / NeuralNetwork'''
+    setattr(model, '_{}__{}'.format(type(model).__name__, name), value)
+
+
+def _cost(Y, A):
+    '''Coût logistique de chaque modèle : A est de forme (K, m), le
+    calcul est celui de Neuron.cost'''
+    # A est borné pour que 0 * log(0) ne donne pas NaN en float32
+    info = np.finfo(A.dtype)
+    A = np.clip(A, info.tiny, 1 - info.eps)
+    cost = Y * np.log(A) + (1 - Y) * np.log(1.0000001 - A)
+    return -np.sum(cost, axis=-1) / A.shape[-1]
+
+
+class _Neurons:
+    '''K neurones empilés : W (K, nx), b (K, 1)'''
+
+    def __init__(self, models):
+        self.W = np.concatenate([model.W for model in models])
+        self.b = np.array(
+            [[model.b] for model in models], dtype=self.W.dtype
+        ).reshape(-1, 1)
+
+    def forward(self, X):
+        # un seul GEMM (K, nx) x (nx, m) pour les K modèles
+        self.A = np.matmul(self.W, X)
+        self.A += self.b
+        _sigmoid(self.A)
+        return self.A
+
+    def backward(self, X, Y, alpha):
+        m = X.shape[1]
+        dz = self.A - Y
+        self.W -= alpha * (np.matmul(dz, X.T) / m)
+        self.b -= alpha * (np.sum(dz, axis=1, keepdims=True) / m)
+
+    def store(self, models):
+        dtype = self.W.dtype
+        for k, model in enumerate(models):
+            _set(model, 'W', self.W[k:k + 1].copy())
+            _set(model, 'b', dtype.type(self.b[k, 0]))
+            _set(model, 'A', self.A[k:k + 1].copy())
+
+
+class _NeuralNetworks:
+    '''K réseaux à une couche cachée empilés : W1 (K, nodes, nx),
+    b1 (K, nodes, 1), W2 (K, 1, nodes), b2 (K, 1, 1)'''
+
+    def __init__(self, models):
+        dtype = models[0].W1.dtype
+        self.W1 = np.stack([model.W1 for model in models])
+        self.b1 = np.stack([model.b1 for model in models])
+        self.W2 = np.stack([model.W2 for model in models])
+        self.b2 = np.array(
+            [np.reshape(model.b2, (1, 1)) for model in models], dtype=dtype
+        )
+
+    def forward(self, X):
+        K, nodes, nx = self.W1.shape
+        # couche cachée : un seul GEMM (K * nodes, nx) x (nx, m)
+        Z1 = np.matmul(self.W1.reshape(K * nodes, nx), X)
+        self.A1 = Z1.reshape(K, nodes, -1) + self.b1
+        _sigmoid(self.A1)
+        # sortie : produit par lots (K, 1, nodes) x (K, nodes, m)
+        self.A2 = np.matmul(self.W2, self.A1)
+        self.A2 += self.b2
+        _sigmoid(self.A2)
+        return self.A2[:, 0]
+
+    def backward(self, X, Y, alpha):
+        K, nodes, nx = self.W1.shape
+        m = X.shape[1]
+        alpha = alpha.reshape(K, 1, 1)
+        dz2 = self.A2 - Y
+        dw2 = np.matmul(dz2, self.A1.transpose(0, 2, 1)) / m
+        db2 = np.sum(dz2, axis=2, keepdims=True) / m
+        dz1 = np.matmul(self.W2.transpose(0, 2, 1), dz2)
+        dz1 *= self.A1 * (1 - self.A1)
+        dw1 = np.matmul(dz1.reshape(K * nodes, m), X.T) / m
+        db1 = np.sum(dz1, axis=2, keepdims=True) / m
+        self.W2 -= alpha * dw2
+        self.b2 -= alpha * db2
+        self.W1 -= alpha * dw1.reshape(K, nodes, nx)
+        self.b1 -= alpha * db1
+
+    def store(self, models):
+        for k, model in enumerate(models):
+            _set(model, 'W1', self.W1[k].copy())
+            _set(model, 'b1', self.b1[k].copy())
+            _set(model, 'W2', self.W2[k].copy())
+            _set(model, 'b2', self.b2[k].copy())
+            _set(model, 'A1', self.A1[k].copy())
+            _set(model, 'A2', self.A2[k].copy())
+
+
+def train_sweep(models, X, Y, iterations=5000, alpha=0.05, step=100):
+    '''Entraîne K modèles de même architecture sur les mêmes données,
+    comme K appels à train(X, Y, iterations, alpha) mais en une seule
+    boucle ; alpha est un flottant ou une suite de K flottants ;
+    retourne les modèles entraînés et les coûts de forme
+    (K, iterations // step + 1), relevés toutes les step itérations'''
+    models = list(models)
+    if not models:
+        raise ValueError('models must not be empty')
+    if all(hasattr(model, 'W1') for model in models):
+        stack = _NeuralNetworks
+    elif all(hasattr(model, 'W') for model in models):
+        stack = _Neurons
+    else:
+        raise TypeError('models must all be Neuron or NeuralNetwork')
+    if any(model.optimizer is not None for model in models):
+        raise ValueError('models must use plain gradient descent')
+    if len({model.dtype for model in models}) != 1:
+        raise TypeError('models must share the same dtype')
+    if type(iterations) is not int:
+        raise TypeError('iterations must be an integer')
+    if iterations < 1:
+        raise ValueError('iterations must be a positive integer')
+    if type(step) is not int:
+        raise TypeError('step must be an integer')
+    if step <= 0 or step > iterations:
+        raise ValueError('step must be positive and <= iterations')
+    dtype = models[0].dtype
+    alphas = np.broadcast_to(
+        np.asarray(alpha, dtype=dtype), (len(models),)
+    ).reshape(-1, 1)
+    if np.any(alphas <= 0):
+        raise ValueError('alpha must be positive')
+    X = np.asarray(X, dtype=dtype)
+    Y = np.asarray(Y, dtype=dtype)
+    weights = stack(models)
+    costs = []
+    for i in range(iterations + 1):
+        A = weights.forward(X)
+        weights.backward(X, Y, alphas)
+        if i % step == 0:
+            costs.append(_cost(Y, A))
+    weights.forward(X)
+    weights.store(models)
+    return models, np.stack(costs, axis=1)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+'''Produits matriciels sur les données d'entrée, qui peuvent être des
+matrices creuses scipy (CSR/CSC) ; partagés par Neuron, NeuralNetwork et
+DeepNeuralNetwork'''
+import numpy as np
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+def issparse(X):
+    '''Vrai si X est une matrice creuse scipy'''
+    return sparse is not None and sparse.issparse(X)
+
+
+def as_input(X, dtype):
+    '''Convertit les données d'entrée au type des calculs ; les matrices
+    creuses restent creuses'''
+    if issparse(X):
+        return X if X.dtype == dtype else X.astype(dtype)
+    return np.asarray(X, dtype=dtype)
+
+
+def matmul(W, X, out=None):
+    '''W · X, dans out s'il est donné ; pour X creux, le produit
+    creux-dense est calculé par scipy'''
+    if issparse(X):
+        product = np.asarray(X.T @ W.T).T
+        if out is None:
+            return product
+        out[...] = product
+        return out
+    return np.matmul(W, X, out=out)
+
+
+def matmul_transposed(dZ, X, out=None):
+    '''dZ · Xᵀ, le gradient des poids de la couche qui reçoit X, dans
+    out s'il est donné'''
+    if issparse(X):
+        product = np.asarray(X @ dZ.T).T
+        if out is None:
+            return product
+        out[...] = product
+        return out
+    return np.matmul(dZ, X.T, out=out)
+
+
+def hessian(X, S):
+    '''X · diag(S) · Xᵀ, S de forme (1, m)'''
+    if issparse(X):
+        return (X.multiply(S) @ X.T).toarray()
+    return np.matmul(X * S, X.T)
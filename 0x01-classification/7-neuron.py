@@ -2,8 +2,14 @@
 """
 Module contenant la classe neurone
 """
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+build_callbacks = __import__('30-hooks').build_callbacks
+sparse_input = __import__('33-sparse_input')
+_as_input = sparse_input.as_input
+_matmul = sparse_input.matmul
+_matmul_transposed = sparse_input.matmul_transposed
+_hessian = sparse_input.hessian
 
 
 class Neuron:
@@ -11,17 +17,26 @@ class Neuron:
     la classe qui définit un neurone
     """
 
-    def __init__(self, nx):
+    def __init__(self, nx, dtype=np.float64, optimizer=None):
         """
         constructeur de la classe
         la variable nx: est le nombre d'entités d'entrée du neurone
+        la variable dtype: type flottant des poids et de tous les calculs
+        la variable optimizer: optimiseur (31-optimizers) utilisé par la
+        descente de gradient, ou None pour W - alpha * dW
         """
         if type(nx) is not int:
             raise TypeError("nx must be an integer")
         if nx < 1:
             raise ValueError("nx must be a positive integer")
+        if not np.issubdtype(dtype, np.floating):
+            raise TypeError("dtype must be a floating point type")
+        if optimizer is not None and not hasattr(optimizer, "update"):
+            raise TypeError("optimizer must provide an update method")
         self.nx = nx
-        self.__W = np.random.randn(1, nx)
+        self.__optimizer = optimizer
+        self.__dtype = np.dtype(dtype)
+        self.__W = np.random.randn(1, nx).astype(self.__dtype)
         self.__b = 0
         self.__A = 0
 
@@ -31,7 +46,8 @@ class Neuron:
          Le paramètre X: un tableau np avec les données d'entrée de forme (nx, m)
          elle retourne : attribut privé __A
         """
-        preactivation = np.matmul(self.__W, X) + self.__b
+        X = _as_input(X, self.__dtype)
+        preactivation = _matmul(self.__W, X) + self.__b
         self.__A = 1 / (1 + np.exp(-preactivation))
         return self.__A
 
@@ -42,6 +58,10 @@ class Neuron:
          Le paramètre A: un tableau np avec la sortie activée de shape (1, m)
          elle retourne : le coût
         """
+        Y = np.asarray(Y, dtype=A.dtype)
+        # A est borné pour que 0 * log(0) ne donne pas NaN en float32
+        info = np.finfo(A.dtype)
+        A = np.clip(A, info.tiny, 1 - info.eps)
         cost = Y * np.log(A) + (1 - Y) * np.log(1.0000001 - A)
         cost = np.sum(cost)
         cost = - cost / A.shape[1]
@@ -68,13 +88,20 @@ class Neuron:
          Le paramètre alpha: le taux d'apprentissage
          elle ne retourne rien
         """
-        dz = A - Y
-        dw = np.matmul(X, dz.T) / A.shape[1]
+        X = _as_input(X, self.__dtype)
+        dz = A - np.asarray(Y, dtype=self.__dtype)
+        dw = _matmul_transposed(dz, X) / A.shape[1]
         db = np.sum(dz) / A.shape[1]
-        self.__W = self.__W - alpha * dw.T
+        if self.__optimizer is not None:
+            self.__W, self.__b = self.__optimizer.update(
+                [self.__W, self.__b], [dw, db], alpha
+            )
+            return
+        self.__W = self.__W - alpha * dw
         self.__b = self.__b - alpha * db
 
-    def train(self, X, Y, iterations=5000, alpha=0.05, verbose=True, graph=True, step=100):
+    def train(self, X, Y, iterations=5000, alpha=0.05, verbose=True, graph=True, step=100,
+              callbacks=None, solver="gd", tol=1e-6):
         """
         elle entraîne le neurone et trace le résultat de l'entraînement
          Le paramètre X: tableau np avec des données d'entrée de forme (nx, m)
@@ -84,8 +111,21 @@ class Neuron:
          Le paramètre verbose: booléen pour définir si imprimer des informations sur l'entraînement
          Le paramètre graphe: booléen pour définir si les informations du graphe sur l'entraînement
          Le paramètre step: itération d'étape pour afficher les informations
+         Le paramètre callbacks: liste de callbacks (30-hooks) notifiés à
+         chaque phase ; le coût n'est calculé que s'ils le demandent
+         Le paramètre solver: "gd" (descente de gradient), "newton"
+         (IRLS) ou "lbfgs" (pour un grand nx) ; avec "newton" et "lbfgs",
+         alpha est ignoré et iterations est un maximum
+         Le paramètre tol: arrêt dès que le gradient est inférieur à tol
+         en valeur absolue (solveurs "newton" et "lbfgs")
          elle retourne : l'évaluation des données d'entraînement
         """
+        if solver not in ("gd", "newton", "lbfgs"):
+            raise ValueError("solver must be 'gd', 'newton' or 'lbfgs'")
+        if type(tol) is not float:
+            raise TypeError("tol must be a float")
+        if tol < 0:
+            raise ValueError("tol must be positive")
         if type(iterations) is not int:
             raise TypeError("iterations must be an integer")
         if iterations < 1:
@@ -104,23 +144,136 @@ class Neuron:
                 raise TypeError("step must be an integer")
             if step <= 0 or step > iterations:
                 raise ValueError("step must be positive and <= iterations")
-        cost = []
+        hooks = build_callbacks(
+            verbose, graph, step, callbacks, title='Training cost'
+        )
+        hooks.on_train_begin(self)
+        if solver != "gd":
+            iterations = self.__solve(X, Y, iterations, solver, tol, hooks)
+            prediction, cost = self.evaluate(X, Y)
+            hooks.on_train_end(self, iterations, cost)
+            return prediction, cost
         for i in range(iterations + 1):
+            hooks.on_iteration_start(self, i)
+            start = time.perf_counter()
             activations = self.forward_prop(X)
+            end = time.perf_counter()
+            hooks.on_forward(self, i, end - start)
             self.gradient_descent(X, Y, activations, alpha)
-            cost.append(self.cost(Y, self.__A))
-            if verbose is True and i % step == 0:
-                print("Cost after {} iterations: {}"
-                      .format(i, cost[i]))
+            start = time.perf_counter()
+            hooks.on_backward(self, i, start - end)
+            cost = None
+            if hooks.wants_cost(i):
+                cost = self.cost(Y, self.__A)
+                hooks.on_cost(self, i, time.perf_counter() - start)
+            hooks.on_iteration_end(self, i, cost)
+            if hooks.should_stop():
+                iterations = i
+                break
 
-        if graph is True:
-            plt.plot(np.arange(0, iterations + 1), cost)
-            plt.title("Training cost")
-            plt.xlabel("iteration")
-            plt.ylabel("cost")
-            plt.show()
+        prediction, cost = self.evaluate(X, Y)
+        hooks.on_train_end(self, iterations, cost)
+        return prediction, cost
 
-        return self.evaluate(X, Y)
+    def __solve(self, X, Y, iterations, solver, tol, hooks, memory=10):
+        """
+        minimise le coût logistique par la méthode de Newton (IRLS) ou
+        par L-BFGS, avec une recherche linéaire par rebroussement ; pour
+        les callbacks, la phase forward est la recherche linéaire (les
+        évaluations de la perte) et la phase backward le calcul de la
+        direction, signalées dans cet ordre après la mise à jour
+         Le paramètre memory: nombre de paires gardées par L-BFGS
+         elle retourne : le nombre d'itérations effectuées
+        """
+        X = _as_input(X, self.__dtype)
+        Y = np.asarray(Y, dtype=self.__dtype)
+        m = X.shape[1]
+
+        def objective(theta):
+            # perte logistique stable, gradient par rapport à (b, W)
+            z = _matmul(theta[1:].reshape(1, -1), X) + theta[0]
+            loss = np.mean(np.logaddexp(0, z) - Y * z)
+            A = 1 / (1 + np.exp(-z))
+            dz = A - Y
+            gradient = np.empty_like(theta)
+            gradient[0] = np.sum(dz) / m
+            gradient[1:] = _matmul_transposed(dz, X)[0] / m
+            return loss, gradient, A
+
+        theta = np.concatenate(([self.__b], self.__W[0])).astype(self.__dtype)
+        loss, gradient, A = objective(theta)
+        history = []
+        i = 0
+        while i < iterations and np.max(np.abs(gradient)) > tol:
+            hooks.on_iteration_start(self, i)
+            cost = None
+            if hooks.wants_cost(i):
+                start = time.perf_counter()
+                cost = self.cost(Y, A)
+                hooks.on_cost(self, i, time.perf_counter() - start)
+            start = time.perf_counter()
+            if solver == "newton":
+                S = A * (1 - A)
+                hessian = np.empty((theta.size, theta.size), self.__dtype)
+                hessian[0, 0] = np.sum(S) / m
+                hessian[1:, 0] = hessian[0, 1:] = _matmul_transposed(S, X)[0] / m
+                hessian[1:, 1:] = _hessian(X, S) / m
+                try:
+                    direction = -np.linalg.solve(hessian, gradient)
+                except np.linalg.LinAlgError:
+                    direction = -np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+            else:
+                # récursion à deux boucles de L-BFGS
+                direction = -gradient
+                alphas = []
+                for s, y, rho in reversed(history):
+                    alphas.append(rho * np.dot(s, direction))
+                    direction -= alphas[-1] * y
+                if history:
+                    s, y, _ = history[-1]
+                    direction *= np.dot(s, y) / np.dot(y, y)
+                for (s, y, rho), a in zip(history, reversed(alphas)):
+                    direction += (a - rho * np.dot(y, direction)) * s
+            slope = np.dot(gradient, direction)
+            if slope >= 0:
+                history.clear()
+                direction, slope = -gradient, -np.dot(gradient, gradient)
+            end = time.perf_counter()
+            backward = end - start
+            # rebroussement jusqu'à une décroissance suffisante (Armijo)
+            step = 1.0
+            for _ in range(50):
+                candidate = theta + step * direction
+                new_loss, new_gradient, new_A = objective(candidate)
+                if new_loss <= loss + 1e-4 * step * slope:
+                    break
+                step /= 2
+            else:
+                break
+            forward = time.perf_counter() - end
+            if solver == "lbfgs":
+                s, y = candidate - theta, new_gradient - gradient
+                if np.dot(s, y) > 1e-10:
+                    history.append((s, y, 1 / np.dot(s, y)))
+                    if len(history) > memory:
+                        history.pop(0)
+            theta, loss, gradient, A = candidate, new_loss, new_gradient, new_A
+            # les callbacks (EarlyStopping) évaluent et copient les poids
+            # courants
+            self.__W = theta[1:].reshape(1, -1).copy()
+            self.__b = theta[0]
+            self.__A = A
+            hooks.on_forward(self, i, forward)
+            hooks.on_backward(self, i, backward)
+            hooks.on_iteration_end(self, i, cost)
+            if hooks.should_stop():
+                # les poids ont pu être restaurés par un callback
+                return i
+            i += 1
+        self.__W = theta[1:].reshape(1, -1).copy()
+        self.__b = theta[0]
+        self.__A = A
+        return i
 
     @property
     def W(self):
@@ -145,3 +298,19 @@ class Neuron:
         elle retourne: sortie activée du neurone
         """
         return self.__A
+
+    @property
+    def optimizer(self):
+        """
+        fonction getter pour optimizer
+        elle retourne: l'optimiseur du neurone, ou None
+        """
+        return self.__optimizer
+
+    @property
+    def dtype(self):
+        """
+        fonction getter pour dtype
+        elle retourne: type flottant des calculs du neurone
+        """
+        return self.__dtype
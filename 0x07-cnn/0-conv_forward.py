@@ -5,7 +5,100 @@ Performs forward propagation over a convolutional layer of a neural network
 import numpy as np
 
 
-def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
+def conv_padding(h_prev, w_prev, kh, kw, sh, sw, padding):
+    """
+    a function that computes the padding of a convolution
+    :param padding: same or valid; same pads so that the output has the
+    size of the input when the stride is 1
+    :return: the padding on each side of the height and width (pad_h, pad_w)
+    """
+    if padding == "same":
+        pad_h = int(np.ceil((((h_prev - 1) * sh + kh - h_prev) / 2)))
+        pad_w = int(np.ceil((((w_prev - 1) * sw + kw - w_prev) / 2)))
+        return pad_h, pad_w
+    return 0, 0
+
+
+def im2col(padded, kh, kw, sh, sw):
+    """
+    a function that unfolds every kernel window of a padded input into a row
+    :param padded: numpy.ndarray of shape (m, h, w, c), already padded
+    :param kh: the kernel height
+    :param kw: the kernel width
+    :param sh: the stride along the height
+    :param sw: the stride along the width
+    :return: the matrix of shape (m * conv_h * conv_w, kh * kw * c) whose
+    columns are ordered like W.reshape(kh * kw * c, c_new), and the output
+    size (conv_h, conv_w)
+    """
+    m, h, w, c = padded.shape
+    # strided view of shape (m, conv_h, conv_w, c, kh, kw), no copy yet
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded, (kh, kw), axis=(1, 2))[:, ::sh, ::sw]
+    conv_h, conv_w = windows.shape[1:3]
+    cols = windows.transpose(0, 1, 2, 4, 5, 3).reshape(
+        m * conv_h * conv_w, kh * kw * c)
+    return cols, (conv_h, conv_w)
+
+
+def fft_is_faster(padded_shape, W_shape, stride, backward=False):
+    """
+    a function that estimates whether the FFT convolution beats im2col
+    :param padded_shape: the shape (m, h, w, c_prev) of the padded input
+    :param W_shape: the shape (kh, kw, c_prev, c_new) of the kernels
+    :param stride: is a tuple of (sh, sw); only stride 1 is considered
+    :param backward: estimate for conv_backward, whose im2col path also
+    folds the windows back with col2im
+    :return: True if the FFT path is expected to be faster
+    """
+    if tuple(stride) != (1, 1):
+        return False
+    m, h, w, c_prev = padded_shape
+    kh, kw, c_prev, c_new = W_shape
+    copy, product, transform, overhead = FFT_COSTS[
+        "backward" if backward else "forward"]
+    # im2col: the GEMM multiply-adds and the window copies; FFT: the
+    # per-frequency channel products, the transforms and a fixed cost
+    # per call that dominates small inputs
+    windows = m * (h - kh + 1) * (w - kw + 1) * kh * kw * c_prev
+    direct = windows * (c_new + copy)
+    fft = (product * m * c_prev * c_new * h * (w // 2 + 1) +
+           transform * m * (c_prev + c_new) * h * w * np.log2(h * w) +
+           overhead)
+    return direct > fft
+
+
+# cost of a window element copy, a per-frequency channel product, a
+# transform element and one FFT call, in GEMM multiply-adds, fitted on
+# timings of both paths over m (1 to 16), size (8 to 64), channels and
+# kernel size; the FFT costs include a margin so that near ties stay on
+# im2col
+FFT_COSTS = {"forward": (36, 40, 30, 2e7), "backward": (110, 72, 21, 1e7)}
+
+
+def conv_fft(padded, W):
+    """
+    a function that computes a stride 1 convolution with FFTs
+    :param padded: numpy.ndarray of shape (m, h, w, c_prev), already padded
+    :param W: numpy.ndarray of shape (kh, kw, c_prev, c_new)
+    :return: numpy.ndarray of shape (m, h - kh + 1, w - kw + 1, c_new), equal
+    to the valid cross-correlation computed by im2col
+    """
+    m, h, w, c_prev = padded.shape
+    kh, kw, c_prev, c_new = W.shape
+    # the spectrum of each image and channel is computed once and reused
+    # for every output channel; valid outputs do not wrap around
+    spectrum = np.fft.rfft2(padded, axes=(1, 2))
+    kernels = np.conj(np.fft.rfft2(W, s=(h, w), axes=(0, 1)))
+    # per frequency: (m, c_prev) x (c_prev, c_new)
+    product = np.matmul(spectrum.transpose(1, 2, 0, 3), kernels)
+    convolved = np.fft.irfft2(product.transpose(2, 0, 1, 3), s=(h, w),
+                              axes=(1, 2))
+    return convolved[:, :h - kh + 1, :w - kw + 1]
+
+
+def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1),
+                 algorithm="auto"):
     """
     a function that performs forward propagation over a CNN
     :param A_prev: numpy.ndarray of shape (m, h_prev, w_prev, c_prev)
@@ -19,6 +112,51 @@ def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
     type of padding used
     :param stride: is a tuple of (sh, sw) containing the strides for the
     convolution
+    :param algorithm: im2col, fft, or auto to pick fft only when
+    fft_is_faster estimates that it wins (large kernels, stride 1)
+    :return: the output of the convolutional layer
+    """
+    m, h_prev, w_prev, c_prev = A_prev.shape
+    kh, kw, c_prev, c_new = W.shape
+    sh, sw = stride
+
+    pad_h, pad_w = conv_padding(h_prev, w_prev, kh, kw, sh, sw, padding)
+    padded = A_prev
+    if pad_h or pad_w:
+        padded = np.pad(A_prev, ((0, 0), (pad_h, pad_h), (pad_w, pad_w),
+                                 (0, 0)),
+                        mode="constant", constant_values=(0, 0))
+
+    if algorithm == "fft" or (
+            algorithm == "auto" and
+            fft_is_faster(padded.shape, W.shape, stride)):
+        # strided outputs are a subset of the stride 1 outputs
+        convolved = conv_fft(padded, W)[:, ::sh, ::sw]
+        return activation(convolved + b)
+
+    # im2col then a single GEMM for every window and every output channel
+    cols, (conv_h, conv_w) = im2col(padded, kh, kw, sh, sw)
+    convolved = np.matmul(cols, W.reshape(kh * kw * c_prev, c_new))
+    convolved = convolved.reshape(m, conv_h, conv_w, c_new)
+    convolved += b
+    return activation(convolved)
+
+
+def conv_forward_loop(A_prev, W, b, activation, padding="same", stride=(1, 1)):
+    """
+    reference implementation of conv_forward, one Python iteration per
+    output row, column and channel; kept to check conv_forward against
+    :param A_prev: numpy.ndarray of shape (m, h_prev, w_prev, c_prev)
+    containing the output of the previous layer
+    :param W: numpy.ndarray of shape (kh, kw, c_prev, c_new) containing the
+    kernels for the convolution
+    :param b: numpy.ndarray of shape (1, 1, 1, c_new) containing the biases
+    applied to the convolution
+    :param activation: is an activation function applied to the convolution
+    :param padding:  is a string that is either same or valid, indicating the
+    type of padding used
+    :param stride: is a tuple of (sh, sw) containing the strides for the
+    convolution
     :return: the output of the convolutional layer
     """
     m, h_prev, w_prev, c_prev = A_prev.shape
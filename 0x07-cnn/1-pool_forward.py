@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """
-Performs forward propagation over a convolutional layer of a neural network
+Performs forward propagation over a pooling layer of a neural network
 """
 import numpy as np
 
 
-def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max'):
+def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max',
+                 return_indices=False):
     """
     a function that performs forward propagation over a CNN
     :param A_prev: numpy.ndarray of shape (m, h_prev, w_prev, c_prev)
@@ -16,22 +17,26 @@ def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max'):
     convolution
     :param mode: a string containing either max or avg, indicating whether to
     perform maximum or average pooling, respectively
-    :return: the output of the convolutional layer
+    :param return_indices: with max pooling, also return the position of the
+    maximum inside each window, as row * kw + col, in an integer
+    numpy.ndarray of shape (m, h_new, w_new, c_prev); a ValueError is raised
+    with average pooling, which has no argmax
+    :return: the output of the pooling layer, and the argmax positions if
+    return_indices is True
     """
-    m, h_prev, w_prev, c_prev = A_prev.shape
+    if return_indices and mode == "avg":
+        raise ValueError("return_indices requires mode='max'")
     kh, kw = kernel_shape
     sh, sw = stride
 
-    pool_h = (h_prev - kh) // sh + 1
-    pool_w = (w_prev - kw) // sw + 1
-
-    pooled = np.zeros((m, pool_h, pool_w, c_prev))
-    # In this notation row refers to height and col to width
-    for row in range(pool_h):
-        for col in range(pool_w):
-            slice_A = A_prev[:, row * sh:row * sh + kh, col * sw:col * sw + kh]
-            if mode == "max":
-                pooled[:, row, col] = np.max(slice_A, axis=(1, 2))
-            if mode == "avg":
-                pooled[:, row, col] = np.mean(slice_A, axis=(1, 2))
-    return pooled
+    # strided view of shape (m, pool_h, pool_w, c_prev, kh, kw), no copy
+    windows = np.lib.stride_tricks.sliding_window_view(
+        A_prev, (kh, kw), axis=(1, 2))[:, ::sh, ::sw]
+    if mode == "avg":
+        return np.mean(windows, axis=(4, 5))
+    if not return_indices:
+        return np.max(windows, axis=(4, 5))
+    flat = windows.reshape(windows.shape[:4] + (kh * kw,))
+    indices = np.argmax(flat, axis=4)
+    pooled = np.take_along_axis(flat, indices[..., None], axis=4)[..., 0]
+    return pooled, indices
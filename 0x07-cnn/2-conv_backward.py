@@ -3,9 +3,66 @@
 Performs backward propagation over a convolutional layer of a neural network
 """
 import numpy as np
+conv_padding = __import__('0-conv_forward').conv_padding
+im2col = __import__('0-conv_forward').im2col
+fft_is_faster = __import__('0-conv_forward').fft_is_faster
 
 
-def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
+def col2im(cols, padded_shape, kh, kw, sh, sw):
+    """
+    a function that folds im2col rows back into an image, adding the values
+    of overlapping windows
+    :param cols: numpy.ndarray of shape (m, conv_h, conv_w, kh, kw, c)
+    :param padded_shape: the shape (m, h, w, c) of the padded image
+    :param kh: the kernel height
+    :param kw: the kernel width
+    :param sh: the stride along the height
+    :param sw: the stride along the width
+    :return: numpy.ndarray of shape padded_shape
+    """
+    conv_h, conv_w = cols.shape[1:3]
+    image = np.zeros(padded_shape, dtype=cols.dtype)
+    # one vectorised scatter-add per kernel position, none per output
+    for i in range(kh):
+        for j in range(kw):
+            image[:, i:i + sh * conv_h:sh, j:j + sw * conv_w:sw] += \
+                cols[:, :, :, i, j]
+    return image
+
+
+def conv_fft_gradients(dZ, A_pad, W, stride):
+    """
+    a function that computes the gradients of a convolution with FFTs
+    :param dZ: numpy.ndarray of shape (m, h_new, w_new, c_new)
+    :param A_pad: numpy.ndarray of shape (m, h, w, c_prev), already padded
+    :param W: numpy.ndarray of shape (kh, kw, c_prev, c_new)
+    :param stride: is a tuple of (sh, sw); dZ is spread with zeros into the
+    stride 1 output grid
+    :return: the gradients with respect to the padded input and the kernels
+    """
+    m, h, w, c_prev = A_pad.shape
+    kh, kw, c_prev, c_new = W.shape
+    sh, sw = stride
+    h_new, w_new = dZ.shape[1:3]
+    if (sh, sw) != (1, 1):
+        spread = np.zeros((m, h - kh + 1, w - kw + 1, c_new), dtype=dZ.dtype)
+        spread[:, :sh * h_new:sh, :sw * w_new:sw] = dZ
+        dZ = spread
+    spectrum_A = np.fft.rfft2(A_pad, axes=(1, 2)).transpose(1, 2, 0, 3)
+    spectrum_dZ = np.fft.rfft2(dZ, s=(h, w), axes=(1, 2)).transpose(1, 2, 0, 3)
+    kernels = np.fft.rfft2(W, s=(h, w), axes=(0, 1))
+    # dW: correlation of the input with dZ, summed over the images
+    product = np.matmul(spectrum_A.transpose(0, 1, 3, 2),
+                        np.conj(spectrum_dZ))
+    dW = np.fft.irfft2(product, s=(h, w), axes=(0, 1))[:kh, :kw]
+    # dA: full convolution of dZ with the kernels, summed over c_new
+    product = np.matmul(spectrum_dZ, kernels.transpose(0, 1, 3, 2))
+    dA_pad = np.fft.irfft2(product, s=(h, w), axes=(0, 1))
+    return dA_pad.transpose(2, 0, 1, 3), dW
+
+
+def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1),
+                  algorithm="auto"):
     """
     a function that performs backward propagation over a CNN
     :param dZ: is a numpy.ndarray of shape (m, h_new, w_new, c_new) containing
@@ -21,6 +78,62 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
     type of padding used
     :param stride: is a tuple of (sh, sw) containing the strides for the
     convolution
+    :param algorithm: im2col, fft, or auto to pick fft only when
+    fft_is_faster estimates that it wins (large kernels, stride 1)
+    :return: the partial derivatives with respect to the previous layer (
+    dA_prev), the kernels (dW), and the biases (db), respectively
+    """
+    m, h_prev, w_prev, c_prev = A_prev.shape
+    m, h_new, w_new, c_new = dZ.shape
+    kh, kw, c_prev, c_new = W.shape
+    sh, sw = stride
+
+    pad_h, pad_w = conv_padding(h_prev, w_prev, kh, kw, sh, sw, padding)
+    A_pad = A_prev
+    if pad_h or pad_w:
+        A_pad = np.pad(A_prev, ((0, 0), (pad_h, pad_h), (pad_w, pad_w),
+                                (0, 0)),
+                       mode="constant", constant_values=(0, 0))
+
+    db = np.sum(dZ, axis=(0, 1, 2), keepdims=True)
+    if algorithm == "fft" or (
+            algorithm == "auto" and
+            fft_is_faster(A_pad.shape, W.shape, stride,
+                          backward=True)):
+        dA_pad, dW = conv_fft_gradients(dZ, A_pad, W, stride)
+        dA = dA_pad[:, pad_h:pad_h + h_prev, pad_w:pad_w + w_prev]
+        return dA, dW, db
+
+    cols = im2col(A_pad, kh, kw, sh, sw)[0]
+    dZ_flat = dZ.reshape(m * h_new * w_new, c_new)
+    W_flat = W.reshape(kh * kw * c_prev, c_new)
+    # dW: one GEMM of the im2col matrix with dZ
+    dW = np.matmul(cols.T, dZ_flat).reshape(W.shape)
+    # dA: one GEMM back to the windows, then col2im scatter-add
+    dcols = np.matmul(dZ_flat, W_flat.T).reshape(
+        m, h_new, w_new, kh, kw, c_prev)
+    dA_pad = col2im(dcols, A_pad.shape, kh, kw, sh, sw)
+    dA = dA_pad[:, pad_h:pad_h + h_prev, pad_w:pad_w + w_prev]
+    return dA, dW, db
+
+
+def conv_backward_loop(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
+    """
+    reference implementation of conv_backward, one Python iteration per
+    image, output row, column and channel; kept to check conv_backward against
+    :param dZ: is a numpy.ndarray of shape (m, h_new, w_new, c_new) containing
+    the partial derivatives with respect to the unactivated output of the
+    convolutional layer
+    :param A_prev: numpy.ndarray of shape (m, h_prev, w_prev, c_prev)
+    containing the output of the previous layer
+    :param W: numpy.ndarray of shape (kh, kw, c_prev, c_new) containing the
+    kernels for the convolution
+    :param b: numpy.ndarray of shape (1, 1, 1, c_new) containing the biases
+    applied to the convolution
+    :param padding:  is a string that is either same or valid, indicating the
+    type of padding used
+    :param stride: is a tuple of (sh, sw) containing the strides for the
+    convolution
     :return: the partial derivatives with respect to the previous layer (
     dA_prev), the kernels (dW), and the biases (db), respectively
     """
@@ -61,8 +174,6 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
                     aux = W[:, :, :, ch] * dZ[img, row, col, ch]
                     dA_img[row_start:row_end, col_start:col_end] += aux
                     dW[:, :, :, ch] += slice_A * dZ[img, row, col, ch]
-        if padding == "same":
-            dA[img, :, :, :] += dA_img[pad_h: -pad_h, pad_w: - pad_w]
-        if padding == "valid":
-            dA[img, :, :, :] += dA_img
+        # a plain [pad_h:-pad_h] slice is empty when the padding is 0
+        dA[img, :, :, :] += dA_img[pad_h:pad_h + h_prev, pad_w:pad_w + w_prev]
     return dA, dW, db
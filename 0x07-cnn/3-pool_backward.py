@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Performs backward propagation over a pooling layer of a neural network
+"""
+import numpy as np
+pool_forward = __import__('1-pool_forward').pool_forward
+
+
+def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max',
+                  indices=None):
+    """
+    a function that performs backward propagation over a pooling layer
+    :param dA: numpy.ndarray of shape (m, h_new, w_new, c) containing the
+    partial derivatives with respect to the output of the pooling layer
+    :param A_prev: numpy.ndarray of shape (m, h_prev, w_prev, c) containing
+    the output of the previous layer
+    :param kernel_shape: a tuple of (kh, kw) containing the size of the kernel
+    for the pooling
+    :param stride: is a tuple of (sh, sw) containing the strides for the
+    pooling
+    :param mode: a string containing either max or avg, indicating whether to
+    perform maximum or average pooling, respectively
+    :param indices: the argmax positions returned by
+    pool_forward(..., return_indices=True); computed from A_prev if None
+    :return: the partial derivatives with respect to the previous layer
+    (dA_prev)
+    """
+    m, h_new, w_new, c = dA.shape
+    kh, kw = kernel_shape
+    sh, sw = stride
+
+    if mode == "avg":
+        # every element of a window receives an equal share of its gradient
+        share = dA / (kh * kw)
+    elif indices is None:
+        indices = pool_forward(A_prev, kernel_shape, stride, mode,
+                               return_indices=True)[1]
+
+    dA_prev = np.zeros(A_prev.shape, dtype=np.result_type(dA, float))
+    # one vectorised scatter-add per kernel position, none per output;
+    # overlapping windows add up
+    for i in range(kh):
+        for j in range(kw):
+            window = dA_prev[:, i:i + sh * h_new:sh, j:j + sw * w_new:sw]
+            if mode == "avg":
+                window += share
+            else:
+                # the gradient of a window goes to its maximum only
+                window += np.where(indices == i * kw + j, dA, 0)
+    return dA_prev
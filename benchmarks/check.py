@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Checks the vectorised CNN functions against the loop references, and
+early stopping with the Neuron solvers
+
+    python benchmarks/check.py
+
+Exits with code 1 if an algorithm disagrees with its reference.
+"""
+import sys
+import numpy as np
+from run import classification, images, load
+
+# (m, h, w, c, kernel, filters, padding, stride): 1x1 kernels, odd and
+# even sizes, both paddings and strides above 1
+SHAPES = [
+    (2, 7, 7, 3, 1, 4, 'same', 1),
+    (2, 7, 7, 3, 1, 4, 'valid', 1),
+    (2, 8, 9, 3, 3, 4, 'same', 1),
+    (2, 8, 9, 3, 3, 4, 'valid', 2),
+    (2, 9, 8, 2, 4, 3, 'same', 2),
+    (1, 12, 12, 2, 5, 3, 'valid', 1),
+]
+ALGORITHMS = ('im2col', 'fft', 'auto')
+
+
+def check_forward(m, h, w, c, kernel, filters, padding, stride):
+    module = load('0x07-cnn', '0-conv_forward')
+    A_prev = images(m, h, w, c)
+    W = images(kernel, kernel, c, filters)
+    b = images(1, 1, 1, filters)
+    args = (A_prev, W, b, np.tanh, padding, (stride, stride))
+    expected = module.conv_forward_loop(*args)
+    return {
+        algorithm: np.abs(
+            module.conv_forward(*args, algorithm=algorithm) - expected
+        ).max()
+        for algorithm in ALGORITHMS
+    }
+
+
+def check_backward(m, h, w, c, kernel, filters, padding, stride):
+    forward = load('0x07-cnn', '0-conv_forward').conv_forward
+    module = load('0x07-cnn', '2-conv_backward')
+    A_prev = images(m, h, w, c)
+    W = images(kernel, kernel, c, filters)
+    b = images(1, 1, 1, filters)
+    Z = forward(A_prev, W, b, lambda x: x, padding, (stride, stride))
+    dZ = images(*Z.shape)
+    args = (dZ, A_prev, W, b, padding, (stride, stride))
+    expected = module.conv_backward_loop(*args)
+    errors = {}
+    for algorithm in ALGORITHMS:
+        result = module.conv_backward(*args, algorithm=algorithm)
+        errors[algorithm] = max(
+            np.abs(got - want).max() for got, want in zip(result, expected)
+        )
+    return errors
+
+
+def check_early_stopping(solver, validation):
+    """
+    trains a Neuron with EarlyStopping and returns how far the restored
+    weights are from the best cost it recorded
+    """
+    Neuron = load('0x01-classification', '7-neuron').Neuron
+    EarlyStopping = load('0x01-classification', '30-hooks').EarlyStopping
+    X, Y = classification(400, 5)
+    X[0] += 4 * Y[0] - 2
+    data = (X[:, 300:], Y[:, 300:]) if validation else (X[:, :300],
+                                                        Y[:, :300])
+    np.random.seed(0)
+    neuron = Neuron(5)
+    stopping = EarlyStopping(tol=1e-1, patience=2,
+                             validation=data if validation else None)
+    neuron.train(X[:, :300], Y[:, :300], 100, verbose=False, graph=False,
+                 callbacks=[stopping], solver=solver)
+    if stopping.stopped_iteration is None:
+        return np.inf
+    return abs(neuron.evaluate(*data)[1] - stopping.best_cost)
+
+
+def main():
+    failed = False
+    for name, check in (('conv_forward', check_forward),
+                        ('conv_backward', check_backward)):
+        for shape in SHAPES:
+            errors = check(*shape)
+            ok = all(error < 1e-8 for error in errors.values())
+            failed = failed or not ok
+            print('{:<14} {:<40} {} {}'.format(
+                name, str(shape), 'ok  ' if ok else 'FAIL',
+                ' '.join('{}={:.1e}'.format(algorithm, error)
+                         for algorithm, error in errors.items())
+            ))
+    for solver in ('newton', 'lbfgs'):
+        for validation in (False, True):
+            error = check_early_stopping(solver, validation)
+            ok = error < 1e-8
+            failed = failed or not ok
+            case = '{} validation={}'.format(solver, validation)
+            print('{:<14} {:<40} {} restored={:.1e}'.format(
+                'early_stopping', case, 'ok  ' if ok else 'FAIL', error
+            ))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
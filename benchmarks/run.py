@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner for the classification, CNN, TensorFlow and Keras code
+
+    python benchmarks/run.py                  # run all, print a table
+    python benchmarks/run.py -o results.json  # also save the results
+    python benchmarks/run.py -c baseline.json # flag regressions
+    python benchmarks/run.py -k conv --quick  # filter, first shape only
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Skip(Exception):
+    """
+    raised by a setup function when a benchmark cannot run here
+    """
+
+
+def load(directory, name):
+    """
+    imports a numbered module of the repository by file path
+    :param directory: project directory, e.g. 0x07-cnn
+    :param name: module file name without .py, e.g. 0-conv_forward
+    :return: the module; its own __import__ calls resolve in directory
+    """
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    # unique name: several projects have modules with the same file name
+    key = '{}.{}'.format(directory, name)
+    if key not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            key, os.path.join(path, name + '.py')
+        )
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except ModuleNotFoundError as error:
+            raise Skip('{} is not installed'.format(error.name))
+        sys.modules[key] = module
+    return sys.modules[key]
+
+
+def optional(name):
+    """
+    imports an optional dependency or skips the benchmark
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        raise Skip('{} is not installed'.format(name))
+
+
+def classification(m, nx, classes=None):
+    """
+    random inputs and labels: binary (1, m) or integer labels (m,)
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((nx, m))
+    if classes is None:
+        return X, (rng.random((1, m)) > 0.5).astype(float)
+    return X, rng.integers(0, classes, m)
+
+
+def images(m, h, w, c):
+    """
+    random NHWC images
+    """
+    return np.random.default_rng(0).standard_normal((m, h, w, c))
+
+
+def neuron_train(m, nx, iterations):
+    Neuron = load('0x01-classification', '7-neuron').Neuron
+    X, Y = classification(m, nx)
+    np.random.seed(0)
+    neuron = Neuron(nx)
+    return lambda: neuron.train(X, Y, iterations, verbose=False, graph=False)
+
+
+def neural_network_train(m, nx, nodes, iterations):
+    NeuralNetwork = load(
+        '0x01-classification', '15-neural_network'
+    ).NeuralNetwork
+    X, Y = classification(m, nx)
+    np.random.seed(0)
+    network = NeuralNetwork(nx, nodes)
+    return lambda: network.train(
+        X, Y, iterations, verbose=False, graph=False
+    )
+
+
+def deep_train(m, nx, layers, iterations, batch_size):
+    DeepNeuralNetwork = load(
+        '0x01-classification', '28-deep_neural_network'
+    ).DeepNeuralNetwork
+    X, Y = classification(m, nx, layers[-1])
+    np.random.seed(0)
+    network = DeepNeuralNetwork(nx, layers)
+    return lambda: network.train(
+        X, Y, iterations, verbose=False, graph=False,
+        batch_size=batch_size
+    )
+
+
+def deep_forward(m, nx, layers):
+    DeepNeuralNetwork = load(
+        '0x01-classification', '28-deep_neural_network'
+    ).DeepNeuralNetwork
+    X, _ = classification(m, nx, layers[-1])
+    np.random.seed(0)
+    network = DeepNeuralNetwork(nx, layers)
+    return lambda: network.forward_prop(X)
+
+
+def conv_forward(m, h, w, c, kernel, filters, padding, stride,
+                 name='conv_forward'):
+    forward = getattr(load('0x07-cnn', '0-conv_forward'), name)
+    A_prev = images(m, h, w, c)
+    W = images(kernel, kernel, c, filters)
+    b = images(1, 1, 1, filters)
+    return lambda: forward(
+        A_prev, W, b, np.tanh, padding, (stride, stride)
+    )
+
+
+def conv_forward_loop(m, h, w, c, kernel, filters, padding, stride):
+    return conv_forward(
+        m, h, w, c, kernel, filters, padding, stride, 'conv_forward_loop'
+    )
+
+
+def pool_forward(m, h, w, c, kernel, stride, mode):
+    forward = load('0x07-cnn', '1-pool_forward').pool_forward
+    A_prev = images(m, h, w, c)
+    return lambda: forward(
+        A_prev, (kernel, kernel), (stride, stride), mode
+    )
+
+
+def pool_backward(m, h, w, c, kernel, stride, mode):
+    forward = load('0x07-cnn', '1-pool_forward').pool_forward
+    backward = load('0x07-cnn', '3-pool_backward').pool_backward
+    A_prev = images(m, h, w, c)
+    dA = np.ones_like(forward(A_prev, (kernel, kernel), (stride, stride)))
+    return lambda: backward(
+        dA, A_prev, (kernel, kernel), (stride, stride), mode
+    )
+
+
+def conv_backward(m, h, w, c, kernel, filters, padding, stride,
+                  name='conv_backward'):
+    backward = getattr(load('0x07-cnn', '2-conv_backward'), name)
+    A_prev = images(m, h, w, c)
+    W = images(kernel, kernel, c, filters)
+    b = images(1, 1, 1, filters)
+    pad = 0
+    if padding == 'same':
+        # same padding formula as conv_forward
+        pad = int(np.ceil(((h - 1) * stride + kernel - h) / 2))
+    h_new = (h + 2 * pad - kernel) // stride + 1
+    w_new = (w + 2 * pad - kernel) // stride + 1
+    dZ = images(m, h_new, w_new, filters)
+    return lambda: backward(dZ, A_prev, W, b, padding, (stride, stride))
+
+
+def conv_backward_loop(m, h, w, c, kernel, filters, padding, stride):
+    return conv_backward(
+        m, h, w, c, kernel, filters, padding, stride, 'conv_backward_loop'
+    )
+
+
+def tensorflow_graph(m, nx, layers, iterations):
+    """
+    returns (tf, X, Y, train) for the TF1 graph benchmarks
+    """
+    tf = optional('tensorflow')
+    if not hasattr(tf, 'Session'):
+        tf = tf.compat.v1
+        tf.disable_eager_execution()
+    train = load('0x02-tensorflow', '6-train').train
+    X, labels = classification(m, nx, layers[-1])
+    Y = np.eye(layers[-1])[labels]
+    save_path = os.path.join(tempfile.mkdtemp(), 'model.ckpt')
+    activations = [tf.nn.tanh] * (len(layers) - 1) + [None]
+
+    def run():
+        tf.reset_default_graph()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return train(
+                X.T, Y, X.T, Y, layers, activations, 0.01, iterations,
+                save_path
+            )
+    return tf, X.T, Y, run
+
+
+def tensorflow_train(m, nx, layers, iterations):
+    return tensorflow_graph(m, nx, layers, iterations)[3]
+
+
+def tensorflow_evaluate(m, nx, layers):
+    tf, X, Y, train = tensorflow_graph(m, nx, layers, 1)
+    evaluate = load('0x02-tensorflow', '7-evaluate').evaluate
+    save_path = train()
+
+    def run():
+        tf.reset_default_graph()
+        return evaluate(X, Y, save_path)
+    return run
+
+
+def keras_model(m, nx, layers):
+    """
+    returns (model, X, Y) for the Keras benchmarks
+    """
+    K = optional('tensorflow.keras')
+    model = K.Sequential(
+        [K.layers.Dense(n, activation='tanh') for n in layers[:-1]] +
+        [K.layers.Dense(layers[-1], activation='softmax')]
+    )
+    model.compile(
+        optimizer='adam', loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    X, labels = classification(m, nx, layers[-1])
+    return model, X.T, np.eye(layers[-1])[labels]
+
+
+def keras_train(m, nx, layers, batch_size, epochs):
+    train_model = load('0x06-keras', '8-train').train_model
+    model, X, Y = keras_model(m, nx, layers)
+    return lambda: train_model(
+        model, X, Y, batch_size, epochs, verbose=False
+    )
+
+
+def keras_predict(m, nx, layers):
+    predict = load('0x06-keras', '13-predict').predict
+    model, X, _ = keras_model(m, nx, layers)
+    return lambda: predict(model, X)
+
+
+# name -> (setup function, parameter sets); the first set is the one
+# used by --quick
+BENCHMARKS = {
+    'neuron.train': (neuron_train, [
+        {'m': 1000, 'nx': 784, 'iterations': 10},
+        {'m': 10000, 'nx': 784, 'iterations': 10},
+    ]),
+    'neural_network.train': (neural_network_train, [
+        {'m': 1000, 'nx': 784, 'nodes': 16, 'iterations': 10},
+        {'m': 10000, 'nx': 784, 'nodes': 64, 'iterations': 10},
+    ]),
+    'deep_neural_network.train': (deep_train, [
+        {'m': 1000, 'nx': 784, 'layers': [64, 32, 10], 'iterations': 10,
+         'batch_size': None},
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10], 'iterations': 10,
+         'batch_size': None},
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10], 'iterations': 1,
+         'batch_size': 32},
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10], 'iterations': 1,
+         'batch_size': 256},
+    ]),
+    'deep_neural_network.forward_prop': (deep_forward, [
+        {'m': 1000, 'nx': 784, 'layers': [64, 32, 10]},
+        {'m': 10000, 'nx': 784, 'layers': [256, 128, 10]},
+    ]),
+    'cnn.conv_forward': (conv_forward, [
+        {'m': 8, 'h': 28, 'w': 28, 'c': 1, 'kernel': 3, 'filters': 8,
+         'padding': 'same', 'stride': 1},
+        {'m': 16, 'h': 32, 'w': 32, 'c': 3, 'kernel': 5, 'filters': 16,
+         'padding': 'valid', 'stride': 1},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 16, 'kernel': 3, 'filters': 32,
+         'padding': 'same', 'stride': 2},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 16, 'kernel': 9, 'filters': 32,
+         'padding': 'same', 'stride': 1},
+        # near the im2col / FFT crossover of fft_is_faster
+        {'m': 16, 'h': 64, 'w': 64, 'c': 16, 'kernel': 5, 'filters': 32,
+         'padding': 'same', 'stride': 1},
+        {'m': 8, 'h': 32, 'w': 32, 'c': 3, 'kernel': 7, 'filters': 16,
+         'padding': 'same', 'stride': 1},
+    ]),
+    'cnn.conv_forward_loop': (conv_forward_loop, [
+        {'m': 8, 'h': 28, 'w': 28, 'c': 1, 'kernel': 3, 'filters': 8,
+         'padding': 'same', 'stride': 1},
+        {'m': 16, 'h': 32, 'w': 32, 'c': 3, 'kernel': 5, 'filters': 16,
+         'padding': 'valid', 'stride': 1},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 16, 'kernel': 3, 'filters': 32,
+         'padding': 'same', 'stride': 2},
+    ]),
+    'cnn.pool_forward': (pool_forward, [
+        {'m': 8, 'h': 28, 'w': 28, 'c': 8, 'kernel': 2, 'stride': 2,
+         'mode': 'max'},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 32, 'kernel': 3, 'stride': 2,
+         'mode': 'avg'},
+    ]),
+    'cnn.pool_backward': (pool_backward, [
+        {'m': 8, 'h': 28, 'w': 28, 'c': 8, 'kernel': 2, 'stride': 2,
+         'mode': 'max'},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 32, 'kernel': 3, 'stride': 2,
+         'mode': 'max'},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 32, 'kernel': 3, 'stride': 2,
+         'mode': 'avg'},
+    ]),
+    'cnn.conv_backward': (conv_backward, [
+        {'m': 4, 'h': 28, 'w': 28, 'c': 1, 'kernel': 3, 'filters': 8,
+         'padding': 'same', 'stride': 1},
+        {'m': 8, 'h': 32, 'w': 32, 'c': 3, 'kernel': 5, 'filters': 16,
+         'padding': 'valid', 'stride': 1},
+        {'m': 16, 'h': 64, 'w': 64, 'c': 16, 'kernel': 9, 'filters': 32,
+         'padding': 'same', 'stride': 1},
+    ]),
+    'cnn.conv_backward_loop': (conv_backward_loop, [
+        {'m': 4, 'h': 28, 'w': 28, 'c': 1, 'kernel': 3, 'filters': 8,
+         'padding': 'same', 'stride': 1},
+        {'m': 8, 'h': 32, 'w': 32, 'c': 3, 'kernel': 5, 'filters': 16,
+         'padding': 'valid', 'stride': 1},
+    ]),
+    'tensorflow.train': (tensorflow_train, [
+        {'m': 1000, 'nx': 784, 'layers': [64, 32, 10], 'iterations': 10},
+    ]),
+    'tensorflow.evaluate': (tensorflow_evaluate, [
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10]},
+    ]),
+    'keras.train_model': (keras_train, [
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10], 'batch_size': 32,
+         'epochs': 1},
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10], 'batch_size': 256,
+         'epochs': 1},
+    ]),
+    'keras.predict': (keras_predict, [
+        {'m': 10000, 'nx': 784, 'layers': [64, 32, 10]},
+    ]),
+}
+
+
+def key(result):
+    """
+    identifies a result across runs: name and parameters
+    """
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+
+def measure(function, repeat):
+    """
+    times function after one warm-up call
+    :return: dict of min, median and mean seconds
+    """
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': float(np.median(times)),
+        'mean': float(np.mean(times)),
+        'repeat': repeat
+    }
+
+
+def run(pattern=None, repeat=5, quick=False):
+    """
+    runs the benchmarks whose name contains pattern
+    :return: list of result dicts; status is ok, skipped or error
+    """
+    results = []
+    for name, (setup, sweep) in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        for params in sweep[:1] if quick else sweep:
+            result = {'name': name, 'params': params}
+            try:
+                result.update(measure(setup(**params), repeat))
+                result['status'] = 'ok'
+            except Skip as error:
+                result.update({'status': 'skipped', 'reason': str(error)})
+            except Exception as error:
+                result.update({'status': 'error', 'reason': repr(error)})
+            results.append(result)
+            print(line(result), flush=True)
+    return results
+
+
+def line(result, extra=''):
+    """
+    formats one result as a table row
+    """
+    params = ' '.join(
+        '{}={}'.format(k, v) for k, v in result['params'].items()
+    )
+    if result['status'] != 'ok':
+        timing = '{:>10}  {}'.format(result['status'], result['reason'])
+    else:
+        timing = '{:>9.2f}ms'.format(result['median'] * 1e3)
+    return '{:<34} {:<70} {}{}'.format(result['name'], params, timing, extra)
+
+
+def compare(results, baseline, threshold):
+    """
+    prints the ratio of each median to the baseline median
+    :param threshold: relative slowdown flagged as a regression, e.g. 0.1
+    :return: list of the regressed results, including the benchmarks that
+    ran in the baseline and now fail
+    """
+    previous = {
+        key(result): result for result in baseline['results']
+        if result['status'] == 'ok'
+    }
+    regressions = []
+    print('\nComparison with the baseline (median time ratio):')
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        if result['status'] == 'error':
+            regressions.append(result)
+            print(line(result, '  REGRESSION'))
+            continue
+        if result['status'] != 'ok':
+            continue
+        ratio = result['median'] / old['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(line(result, '  x{:.2f}{}'.format(ratio, flag)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-k', '--filter', help='run names containing this')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true',
+                        help='only the first parameter set of each')
+    parser.add_argument('-o', '--output', help='save the results as JSON')
+    parser.add_argument('-c', '--compare', help='baseline JSON to compare')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='slowdown flagged as regression (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error('repeat must be a positive integer')
+    results = run(args.filter, args.repeat, args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'machine': platform.machine(),
+                    'processor': platform.processor(),
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+                },
+                'results': results
+            }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('\n{} regression(s)'.format(len(regressions)))
+            return 1
+    errors = [result for result in results if result['status'] == 'error']
+    if errors:
+        print('\n{} error(s)'.format(len(errors)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())